@@ -5,20 +5,44 @@ from flask_login import LoginManager
 from models import db, User
 from routes.auth import auth_bp
 from routes.discovery import discovery_bp
+from routes.history import history_bp
+from services.identity import identity_cache
 from services.lan import lan_service
+from services.leaderboard import leaderboard
+from services.passwords import password_hasher
+from services.results import result_writer
 
-def create_app():
+def base_app():
+    # Config and database only; create_app() adds everything that serves
     app = Flask(__name__)
     app.config['SECRET_KEY'] = 'dev-secret-key' # TODO: Change in production
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-    CORS(app, supports_credentials=True, resources={r"/*": {"origins": "*"}}) # Allow all origins for LAN dev
-    
     app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
     app.config['SESSION_COOKIE_SECURE'] = False # Set to True for HTTPS
-    
+    # Overrides from FLASK_* environment variables, values parsed as JSON
+    # (e.g. FLASK_ROOM_TTL, or the SHARD_* keys set by shard.py)
+    app.config.from_prefixed_env()
     db.init_app(app)
+    return app
+
+def create_schema(app):
+    # shard.py runs this once before it spawns workers, so they don't race
+    # each other creating the same tables
+    with app.app_context():
+        db.create_all()
+        # create_all skips indexes on tables that already exist
+        for index in User.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+
+def create_app():
+    app = base_app()
+
+    CORS(app, supports_credentials=True, resources={r"/*": {"origins": "*"}}) # Allow all origins for LAN dev
+    
+    result_writer.init_app(app)
+    password_hasher.configure(app.config)
+    identity_cache.configure(app.config)
     
     login_manager = LoginManager()
     login_manager.init_app(app)
@@ -26,15 +50,20 @@ def create_app():
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        # Cached, as every authenticated request (state polls included) loads the user
+        return identity_cache.get(int(user_id), lambda uid: db.session.get(User, uid))
 
     from routes.game import game_bp
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(discovery_bp, url_prefix='/api/discovery')
     app.register_blueprint(game_bp, url_prefix='/api/game')
+    app.register_blueprint(history_bp, url_prefix='/api/history')
 
+    create_schema(app)
     with app.app_context():
-        db.create_all()
+        # Warm the in-memory leaderboard, scanning in index order
+        leaderboard.load(db.session.query(User.username, User.wins, User.losses, User.draws)
+                         .order_by(User.wins.desc()).all())
 
     return app
 
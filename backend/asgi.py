@@ -0,0 +1,361 @@
+import asyncio
+import json
+import re
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from werkzeug.http import parse_cookie, parse_etags
+
+from app import create_app
+from models import db, User
+from routes.game import (rooms, SSE_HEARTBEAT, SSE_RETRY_MS, play_move, toggle_player_ready,
+                         send_room_emote, spectator_state_frame)
+from services.rules import room_rules
+from services.lan import lan_service
+from services.sharding import backplane
+from services.results import result_writer
+from services.identity import identity_cache
+
+# Async entry point: `uvicorn asgi:app --host 0.0.0.0 --port 5001` from backend/.
+# Long-polls (/state?since=&wait=) and event streams (/events) are served
+# here as coroutines parked on RoomFeed.wait_async, so an idle client costs
+# a future rather than a thread. Every other route goes to the Flask app
+# through WsgiToAsgi, which runs it on a worker thread as before.
+#
+# /api/game/<id>/ws is a per-room WebSocket. Clients send binary frames,
+# one opcode byte then its payload:
+#   0x01 MOVE       u8 index into the room's rule set moves
+#   0x02 MOVE_NAME  utf-8 move name
+#   0x03 READY      (toggle)
+#   0x04 EMOTE      utf-8 emote id
+# and get a binary reply per frame: opcode u8 | HTTP-style status u16 |
+# utf-8 error message (empty on success). Room events are pushed as text
+# frames holding the same JSON as the SSE stream, starting after ?since=.
+#
+# /api/game/<id>/spectate is a login-free, read-only event stream for
+# viewers outside the room, fanned out through services/spectators.py.
+
+WSGI_THREADS = 32 # Flask requests in flight, like app.run(threaded=True)
+ACTION_THREADS = 8 # Socket actions and state encodes in flight, off the event loop
+
+class ThreadedWsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs WSGI apps thread-sensitively, i.e. every request on one
+    # shared thread; Flask handlers are thread-safe, so give them a pool.
+    # Rewraps the undecorated run_wsgi_app (SyncToAsync.func), which is not
+    # public API: asgiref is pinned in requirements.txt for this.
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False,
+                                 executor=ThreadPoolExecutor(WSGI_THREADS, thread_name_prefix='wsgi'))
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await ThreadedWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+flask_app = create_app()
+wsgi = ThreadedWsgiToAsgi(flask_app)
+# room.lock is a threading lock that request threads and the scheduler also
+# hold, so nothing that takes it may run on the event loop
+actions = ThreadPoolExecutor(ACTION_THREADS, thread_name_prefix='action')
+
+STATE_PATH = re.compile(r'^/api/game/([^/]+)/state$')
+EVENTS_PATH = re.compile(r'^/api/game/([^/]+)/events$')
+SOCKET_PATH = re.compile(r'^/api/game/([^/]+)/ws$')
+SPECTATE_PATH = re.compile(r'^/api/game/([^/]+)/spectate$')
+
+OP_MOVE, OP_MOVE_NAME, OP_READY, OP_EMOTE = 0x01, 0x02, 0x03, 0x04
+REPLY = struct.Struct('!BH')
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        path = scope['path']
+        match = STATE_PATH.match(path)
+        if match:
+            return await game_state(scope, send, match.group(1))
+        match = EVENTS_PATH.match(path)
+        if match:
+            return await stream_events(scope, receive, send, match.group(1))
+        match = SPECTATE_PATH.match(path)
+        if match:
+            return await spectate(scope, receive, send, match.group(1))
+    if scope['type'] == 'websocket':
+        match = SOCKET_PATH.match(scope['path'])
+        if match:
+            return await game_socket(scope, receive, send, match.group(1))
+        return await send({'type': 'websocket.close', 'code': 4404})
+    await wsgi(scope, receive, send)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            if backplane.shard_id == 0: # sharded, only shard 0 runs discovery
+                lan_service.start_listening()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await asyncio.get_running_loop().run_in_executor(None, result_writer.flush)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+def request_headers(scope):
+    headers = {}
+    for name, value in scope['headers']:
+        headers[name.decode('latin-1')] = value.decode('latin-1')
+    return headers
+
+def session_user(headers):
+    # Same check as @login_required, without a DB hit: flask_login keeps the
+    # user id in Flask's signed session cookie
+    cookie = parse_cookie(headers.get('cookie', '')).get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not cookie: return None
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        session = serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except Exception:
+        return None
+    return session.get('_user_id')
+
+def response_headers(headers, content_type=None, extra=()):
+    # Mirrors the app's CORS setup: any origin, with credentials
+    out = [(b'cache-control', b'no-cache')]
+    if content_type:
+        out.append((b'content-type', content_type.encode()))
+    origin = headers.get('origin')
+    if origin:
+        out += [(b'access-control-allow-origin', origin.encode('latin-1')),
+                (b'access-control-allow-credentials', b'true'),
+                (b'vary', b'Origin')]
+    out += [(name.encode(), value.encode()) for name, value in extra]
+    return out
+
+async def respond(send, headers, status, body=b'', content_type='application/json', extra=()):
+    hdrs = response_headers(headers, content_type if body else None, extra)
+    hdrs.append((b'content-length', str(len(body)).encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': hdrs})
+    await send({'type': 'http.response.body', 'body': body})
+
+def error(message):
+    return json.dumps({'error': message}).encode()
+
+def query_int(query, name, default=None, cast=int):
+    try:
+        return cast(query[name][0])
+    except (KeyError, ValueError):
+        return default
+
+async def game_state(scope, send, game_id):
+    # Async twin of routes.game.get_game_state
+    headers = request_headers(scope)
+    user_id = session_user(headers)
+    if user_id is None:
+        return await respond(send, headers, 401, error('Unauthorized'))
+    room = rooms.get(game_id)
+    if not room: return await respond(send, headers, 404, error('Game not found'))
+    feed = room.feed
+
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    since = query_int(query, 'since')
+    wait = query_int(query, 'wait', 0, float)
+    if since is not None and wait > 0:
+        await feed.wait_async(since, wait)
+        if feed.closed: return await respond(send, headers, 404, error('Game not found'))
+
+    etag = feed.etag()
+    extra = [('etag', f'"{etag}"')]
+    if parse_etags(headers.get('if-none-match')).contains(etag) or (since is not None and feed.version <= since):
+        return await respond(send, headers, 304, extra=extra)
+    body = await asyncio.get_running_loop().run_in_executor(actions, member_state, room, user_id)
+    await respond(send, headers, 200, body, extra=extra)
+
+def member_state(room, user_id):
+    # Players see each other's LAN addresses, other users get the spectator view
+    username = session_username(user_id)
+    with room.lock:
+        return room.feed.encode(room, spectator=username not in room.players)
+
+def spectator_state(room):
+    # (version, encoded spectator view) as one consistent snapshot
+    with room.lock:
+        return room.feed.version, room.feed.encode(room, spectator=True)
+
+async def stream_events(scope, receive, send, game_id):
+    # Async twin of routes.game.stream_events
+    headers = request_headers(scope)
+    if session_user(headers) is None:
+        return await respond(send, headers, 401, error('Unauthorized'))
+    room = rooms.get(game_id)
+    if not room: return await respond(send, headers, 404, error('Game not found'))
+    feed = room.feed
+    try:
+        last_id = int(headers['last-event-id'])
+    except (KeyError, ValueError):
+        last_id = query_int(parse_qs(scope['query_string'].decode('latin-1')), 'since', feed.version)
+
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': response_headers(headers, 'text/event-stream', [('x-accel-buffering', 'no')])})
+
+    async def chunk(text):
+        await send({'type': 'http.response.body', 'body': text.encode(), 'more_body': True})
+
+    async def pump(last_id):
+        await chunk(f'retry: {SSE_RETRY_MS}\n\n')
+        while True:
+            frames, complete = feed.frames_since(last_id)
+            if not complete:
+                # Missed events fell out of the buffer, client must refetch /state
+                last_id = feed.version
+                await chunk(f'id: {last_id}\ndata: {{"type": "resync", "id": {last_id}}}\n\n')
+                continue
+            if frames:
+                last_id += len(frames)
+                await chunk(''.join(frames))
+                continue
+            if feed.closed:
+                await chunk('data: {"type": "room_closed"}\n\n')
+                return
+            if await feed.wait_async(last_id, SSE_HEARTBEAT) == last_id and not feed.closed:
+                await chunk(': ping\n\n')
+
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    streaming = asyncio.ensure_future(pump(last_id))
+    watcher = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait([streaming, watcher], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        streaming.cancel()
+        watcher.cancel()
+    if streaming.done() and not streaming.cancelled() and streaming.exception() is None:
+        await send({'type': 'http.response.body', 'body': b''})
+
+async def spectate(scope, receive, send, game_id):
+    # Async twin of routes.game.spectate, fed by the room's SpectatorHub:
+    # each event is encoded once and queued to every viewer, and a viewer
+    # whose queue overflows is sent 'dropped' and disconnected
+    headers = request_headers(scope)
+    room = rooms.get(game_id)
+    if not room: return await respond(send, headers, 404, error('Game not found'))
+    feed = room.feed
+    hub = feed.spectators
+    viewer = hub.subscribe()
+    version, view = await asyncio.get_running_loop().run_in_executor(actions, spectator_state, room)
+
+    async def chunk(data):
+        await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+    async def pump():
+        await chunk(f'retry: {SSE_RETRY_MS}\n\n{spectator_state_frame(version, view)}'.encode())
+        viewer.closed = viewer.closed or feed.closed
+        while True:
+            viewer.ready.clear()
+            if viewer.dropped:
+                return await chunk(b'data: {"type": "dropped"}\n\n')
+            # Frames queued before the state snapshot are already in it
+            frames = [frame for event_id, frame in viewer.frames if event_id > version]
+            viewer.frames.clear()
+            if frames:
+                await chunk(b''.join(frames))
+            if viewer.closed:
+                return await chunk(b'data: {"type": "room_closed"}\n\n')
+            if viewer.frames: continue
+            try:
+                await asyncio.wait_for(viewer.ready.wait(), SSE_HEARTBEAT)
+            except asyncio.TimeoutError:
+                await chunk(b': ping\n\n')
+
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': response_headers(headers, 'text/event-stream', [('x-accel-buffering', 'no')])})
+    streaming = asyncio.ensure_future(pump())
+    watcher = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait([streaming, watcher], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        streaming.cancel()
+        watcher.cancel()
+        hub.unsubscribe(viewer)
+    if streaming.done() and not streaming.cancelled() and streaming.exception() is None:
+        await send({'type': 'http.response.body', 'body': b''})
+
+def session_username(user_id):
+    with flask_app.app_context():
+        user = identity_cache.get(int(user_id), lambda uid: db.session.get(User, uid))
+        return user.username if user else None
+
+def room_action(room, username, frame):
+    # Runs a game action for one client frame, on the actions pool: it takes
+    # the room lock and may fsync the journal. A socket's frames still run
+    # one at a time, in order.
+    op, payload = frame[0], frame[1:]
+    if op == OP_MOVE:
+        moves = room_rules(room).moves
+        if len(payload) != 1 or payload[0] >= len(moves):
+            return {'error': 'Invalid move'}, 400
+        return play_move(room, username, moves[payload[0]])
+    if op == OP_MOVE_NAME:
+        return play_move(room, username, payload.decode(errors='replace'))
+    if op == OP_READY:
+        return toggle_player_ready(room, username)
+    if op == OP_EMOTE:
+        return send_room_emote(room, username, payload.decode(errors='replace'))
+    return {'error': 'Unknown opcode'}, 400
+
+async def game_socket(scope, receive, send, game_id):
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    headers = request_headers(scope)
+    loop = asyncio.get_running_loop()
+    user_id = session_user(headers)
+    username = user_id and await loop.run_in_executor(None, session_username, user_id)
+    if username is None:
+        return await send({'type': 'websocket.close', 'code': 4401})
+    room = rooms.get(game_id)
+    if not room:
+        return await send({'type': 'websocket.close', 'code': 4404})
+    feed = room.feed
+    await send({'type': 'websocket.accept'})
+
+    async def push(last_id):
+        while True:
+            payloads, complete = feed.payloads_since(last_id)
+            if not complete:
+                last_id = feed.version
+                payloads = [json.dumps({'type': 'resync', 'id': last_id})]
+            else:
+                last_id += len(payloads)
+            for payload in payloads:
+                await send({'type': 'websocket.send', 'text': payload})
+            if feed.closed:
+                await send({'type': 'websocket.send', 'text': '{"type": "room_closed"}'})
+                return await send({'type': 'websocket.close', 'code': 1000})
+            if not payloads:
+                await feed.wait_async(last_id, SSE_HEARTBEAT)
+
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    pusher = asyncio.ensure_future(push(query_int(query, 'since', feed.version)))
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            frame = message.get('bytes')
+            if not frame:
+                continue
+            body, status = await loop.run_in_executor(actions, room_action, room, username, frame)
+            await send({'type': 'websocket.send',
+                        'bytes': REPLY.pack(frame[0], status) + body.get('error', '').encode()})
+    finally:
+        pusher.cancel()
+        await asyncio.gather(pusher, return_exceptions=True) # it may have died on a closed socket
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5001)
@@ -7,9 +7,49 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(120), nullable=False)
-    wins = db.Column(db.Integer, default=0)
+    wins = db.Column(db.Integer, default=0, index=True)
     losses = db.Column(db.Integer, default=0)
     draws = db.Column(db.Integer, default=0)
 
     def __repr__(self):
         return f'<User {self.username}>'
+
+# --- Match history, written in bulk at game over (services/results.py) ---
+
+class Match(db.Model):
+    id = db.Column(db.String(36), primary_key=True) # the room's game_id
+    host = db.Column(db.String(80), nullable=False)
+    rule_set = db.Column(db.String(20), nullable=False)
+    rounds = db.Column(db.Integer, nullable=False)
+    finished_at = db.Column(db.Float, nullable=False, index=True)
+
+class MatchPlayer(db.Model):
+    # One row per player per match; (username, finished_at) serves a user's
+    # latest matches as an index range scan
+    match_id = db.Column(db.String(36), db.ForeignKey('match.id'), primary_key=True)
+    username = db.Column(db.String(80), primary_key=True)
+    score = db.Column(db.Integer, nullable=False)
+    result = db.Column(db.String(4), nullable=False) # 'win' | 'loss' | 'draw'
+    finished_at = db.Column(db.Float, nullable=False)
+    __table_args__ = (db.Index('ix_match_player_history', 'username', 'finished_at'),)
+
+class RoundResult(db.Model):
+    match_id = db.Column(db.String(36), db.ForeignKey('match.id'), primary_key=True)
+    round = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), primary_key=True)
+    move = db.Column(db.String(20), nullable=False)
+    score_delta = db.Column(db.Integer, nullable=False)
+
+# Per-user aggregates, upserted with each batch so stats never scan rounds
+
+class MoveStat(db.Model):
+    username = db.Column(db.String(80), primary_key=True)
+    move = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class HeadToHead(db.Model):
+    username = db.Column(db.String(80), primary_key=True)
+    opponent = db.Column(db.String(80), primary_key=True)
+    wins = db.Column(db.Integer, nullable=False, default=0)
+    losses = db.Column(db.Integer, nullable=False, default=0)
+    draws = db.Column(db.Integer, nullable=False, default=0)
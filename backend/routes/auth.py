@@ -1,10 +1,22 @@
 from flask import Blueprint, request, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
 from models import db, User
+from services.bots import BOT_PREFIX
+from services.identity import identity_cache
+from services.leaderboard import leaderboard
+from services.passwords import password_hasher, HasherBusy
+from services.sharding import backplane
 
 auth_bp = Blueprint('auth', __name__)
 
+BUSY_RETRY_AFTER = 2 # Seconds, sent when the password hasher is saturated
+
+@auth_bp.errorhandler(HasherBusy)
+def hasher_busy(_):
+    # A login storm is queued up on the hasher, shed it rather than tie up
+    # request threads that gameplay needs
+    return jsonify({'error': 'Server busy, try again shortly'}), 503, {'Retry-After': str(BUSY_RETRY_AFTER)}
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.json
@@ -14,13 +26,18 @@ def register():
     if not username or not password:
         return jsonify({'error': 'Missing username or password'}), 400
 
+    if username.startswith(BOT_PREFIX):
+        return jsonify({'error': 'Username is reserved'}), 400
+
     if User.query.filter_by(username=username).first():
         return jsonify({'error': 'Username already exists'}), 400
 
-    hashed_password = generate_password_hash(password, method='scrypt')
+    hashed_password = password_hasher.hash(password)
     new_user = User(username=username, password_hash=hashed_password)
     db.session.add(new_user)
     db.session.commit()
+    leaderboard.add_user(username)
+    backplane.broadcast('user', username)
 
     return jsonify({'message': 'User registered successfully'}), 201
 
@@ -31,7 +48,7 @@ def login():
     password = data.get('password')
 
     user = User.query.filter_by(username=username).first()
-    if user and check_password_hash(user.password_hash, password):
+    if user and password_hasher.verify(user.password_hash, password):
         login_user(user)
         return jsonify({'message': 'Logged in successfully', 'username': user.username}), 200
     
@@ -40,6 +57,7 @@ def login():
 @auth_bp.route('/logout', methods=['POST'])
 @login_required
 def logout():
+    identity_cache.invalidate(current_user.id)
     logout_user()
     return jsonify({'message': 'Logged out successfully'}), 200
 
@@ -1,9 +1,14 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, Response
 from flask_login import login_required, current_user
 from services.lan import lan_service
 
 discovery_bp = Blueprint('discovery', __name__)
 
+@discovery_bp.record_once
+def configure(state):
+    # Optional DISCOVERY_* overrides, see LANDiscovery.configure
+    lan_service.configure(state.app.config)
+
 @discovery_bp.route('/start', methods=['POST'])
 @login_required
 def start_discovery():
@@ -13,10 +18,9 @@ def start_discovery():
 
 @discovery_bp.route('/peers', methods=['GET'])
 def get_peers():
-    # We might want to filter out ourselves if the frontend doesn't
-    peers = lan_service.get_active_peers()
-    # Filter only if logged in
-    if current_user.is_authenticated:
-       peers = [p for p in peers if p['username'] != current_user.username]
-       
-    return jsonify(peers), 200
+    # Pre-serialized by the peer registry; filter out ourselves only if logged in
+    exclude = current_user.username if current_user.is_authenticated else None
+    body = lan_service.peers.payload(exclude)
+    resp = Response(body, mimetype='application/json')
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
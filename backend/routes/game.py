@@ -1,39 +1,232 @@
-import uuid
-import requests
-from flask import Blueprint, request, jsonify
+import json
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
+import random
 import time
-from models import db, User
+from services.rules import RULE_SETS, DEFAULT_RULE_SET, room_rules
+from services.bots import Bot, BOT_STRATEGIES, MAX_BOTS, bot_name
+from services.store import RoomStore, InviteStore, Room, PlayerState
+from services.expiry import RoomReaper
+from services.leaderboard import leaderboard
+from services.results import game_outcome, result_writer
+from services.peers import peer_client
+from services.lan import lan_service
+from services.sharding import backplane
+from services.journal import journal
+from services.identity import identity_cache
+from services.passwords import password_hasher
+from services.matchmaking import MatchQueue, rating
+from services.deadlines import RoundTimer, TIMEOUT_POLICIES, MAX_MOVE_TIMEOUT
+from services.scheduler import scheduler
 
 game_bp = Blueprint('game', __name__)
 
-# In-memory storage
-# Structure:
-# games[game_id] = {
+# In-memory storage, see services/store.py.
+# rooms.get(game_id) -> Room, serialized by Room.to_dict() as:
+# {
 #   'host': 'username',
 #   'state': 'lobby' | 'active' | 'finished',
-#   'settings': {'max_players': 2, 'best_of': 1, 'password': ''},
+#   'settings': {'max_players': 2, 'best_of': 1, 'password': '', 'rule_set': 'rpsls',
+#                'move_timeout': 0, 'timeout_policy': 'forfeit'},  # 0 = no move deadline
 #   'players': {
 #       'username': {'status': 'not_ready', 'score': 0, 'move': None, 'ip': '...', 'joined_at': ...}
+#       'bot:markov:1': {..., 'bot': True}  # server-side AI, see services/bots.py
 #   },
 #   'current_round': 1,
-#   'last_event': None
+#   'deadline': None,  # epoch seconds the round's moves are due (move_timeout)
+#   'last_event': None,
+#   'version': 0  # bumped on every mutation, see RoomFeed
 # }
-games = {} 
-invites = {} 
+# Clients get Room.public_dict() instead: settings carry 'has_password'
+# for 'password', players 'has_moved' for 'move' until the game is over,
+# and 'ip' only goes to users who are in the room.
+rooms = RoomStore()
+invites = InviteStore()
+
+def room_evicted(game_id):
+    journal.removed(game_id)
+    lobby_changed()
+
+reaper = RoomReaper(rooms, on_evict=room_evicted)
+
+MAX_ROOM_PLAYERS = 500
+MATCH_MAX_PLAYERS = 8 # Largest room the matchmaking queue will fill
+MATCH_BEST_OF = 3
+MATCH_MOVE_TIMEOUT = 30 # Seconds per round in matchmade rooms
+INVITE_TIMEOUT = 2 # Seconds per peer for /invite calls
+LOBBY_REPORT_INTERVAL = 10 # Seconds between lobby summaries sent to shard 0 (sharded mode)
+
+SSE_HEARTBEAT = 15 # Seconds between keep-alive comments on idle streams
+SSE_RETRY_MS = 2000
+
+@game_bp.record_once
+def configure(state):
+    # Optional overrides: ROOM_TTL = {'lobby': s, 'active': s, 'finished': s}, INVITE_TTL = s
+    reaper.ttl.update(state.app.config.get('ROOM_TTL', {}))
+    invites.ttl = state.app.config.get('INVITE_TTL', invites.ttl)
+    peer_client.configure(state.app.config)
+    backplane.configure(state.app.config)
+    journal.configure(state.app.config)
+    restore_rooms(journal.load())
+    if backplane.enabled and backplane.shard_id != 0:
+        report_lobby()
+
+def restore_rooms(saved):
+    # Rooms rebuilt from the journal after a restart. Bots come back without
+    # their move history; SSE clients resuming from before the restart get
+    # a resync since the event buffer starts empty.
+    for game_id, data in saved.items():
+        room = Room(game_id, data['host'], data['settings'])
+        room.state = data['state']
+        room.current_round = data['round']
+        for username, (status, score, move, ip, joined_at, bot) in data['players'].items():
+            player = PlayerState(username, ip, status=status, bot=bot)
+            player.score, player.move, player.joined_at = score, move, joined_at
+            room.players[username] = player
+        rules = room_rules(room)
+        room.bots = {name: Bot(name, strategy, rules) for name, strategy in data['bots'].items()}
+        room.last_event = data['last_event']
+        room.rounds = [tuple(r) for r in data.get('rounds', [])]
+        room.version = room.feed.version = data['version']
+        rooms.add(room)
+        reaper.watch(room)
+        if room.state == 'active':
+            with room.lock:
+                round_timer.arm(room) # the round in progress gets a fresh deadline
+
+def open_room(room):
+    rooms.add(room)
+    reaper.watch(room)
+    if room.last_event:
+        room.feed.publish(room, room.last_event)
+    journal.record(room, room.last_event)
+    lobby_changed()
+
+def close_room(game_id):
+    rooms.remove(game_id)
+    journal.removed(game_id)
+    lobby_changed()
+
+# Events that can change lobby_summary(); the rest (moves, ready toggles,
+# emotes, round results) leave the LAN beacon alone
+LOBBY_EVENTS = {'player_joined', 'player_left', 'game_start'}
+
+def publish(room, event):
+    room.feed.publish(room, event)
+    journal.record(room, event)
+    if event['type'] in LOBBY_EVENTS:
+        lobby_changed()
+
+def local_lobby_summary():
+    # (open rooms, open seats) on this shard
+    lobby = rooms.rooms_in_state('lobby')
+    return len(lobby), sum(max(r.settings['max_players'] - len(r.players), 0) for r in lobby)
+
+# Sharded mode: {shard: (open rooms, open seats, monotonic time received)}
+# as last reported to shard 0, which runs LAN discovery
+remote_lobbies = {}
+
+def lobby_summary():
+    # Advertised in our LAN discovery beacon: this shard's lobby plus every
+    # other shard's report, unless it has gone quiet
+    open_rooms, open_seats = local_lobby_summary()
+    now = time.monotonic()
+    for n_rooms, n_seats, received in list(remote_lobbies.values()):
+        if now - received <= 3 * LOBBY_REPORT_INTERVAL:
+            open_rooms += n_rooms
+            open_seats += n_seats
+    return open_rooms, open_seats
+
+def lobby_changed():
+    # Our lobby summary may have changed: shard 0 (or an unsharded server)
+    # wakes its beacon, other shards report to shard 0
+    if backplane.shard_id == 0:
+        lan_service.notify_change()
+    else:
+        backplane.send(0, 'lobby', {'shard': backplane.shard_id, 'summary': local_lobby_summary()})
+
+def report_lobby():
+    # Periodic resend, so a restarted shard 0 catches up
+    lobby_changed()
+    scheduler.call_later(LOBBY_REPORT_INTERVAL, report_lobby)
+
+def lobby_reported(msg):
+    remote_lobbies[msg['shard']] = (*msg['summary'], time.monotonic())
+    lan_service.notify_change()
+
+lan_service.summary_provider = lobby_summary
+
+# Sharded mode (shard.py): other workers' copies of replicated state
+backplane.on('leaderboard', leaderboard.record)
+backplane.on('user', leaderboard.add_user)
+backplane.on('invite', lambda msg: invites.add(msg['target_user'], msg['invite']))
+backplane.on('lobby', lobby_reported)
 
 @game_bp.route('/leaderboard', methods=['GET'])
 def get_leaderboard():
-    users = User.query.order_by(User.wins.desc()).limit(10).all()
-    result = []
-    for u in users:
-        result.append({
-            'username': u.username,
-            'wins': u.wins,
-            'losses': u.losses,
-            'draws': u.draws
-        })
-    return jsonify(result), 200
+    # Served from memory (services/leaderboard.py). The default top 10 is
+    # pre-encoded and supports If-None-Match; ?offset=&limit= pages further.
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', type=int)
+    if offset or limit:
+        return jsonify(leaderboard.page(max(offset, 0), min(max(limit or 10, 1), 100))), 200
+
+    etag = leaderboard.etag()
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = Response(leaderboard.encoded_top(), mimetype='application/json')
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+@game_bp.route('/leaderboard/rank/<username>', methods=['GET'])
+def get_rank(username):
+    entry = leaderboard.entry(username)
+    if entry is None: return jsonify({'error': 'User not found'}), 404
+    entry['rank'] = leaderboard.rank(username)
+    return jsonify(entry), 200
+
+@game_bp.route('/rooms', methods=['GET'])
+def list_rooms():
+    # ?state=lobby (default) lists joinable rooms, ?player=<name> a user's rooms
+    player = request.args.get('player')
+    if player:
+        found = rooms.rooms_with_player(player)
+    else:
+        found = rooms.rooms_in_state(request.args.get('state', 'lobby'))
+    return jsonify([{
+        'game_id': r.game_id,
+        'host': r.host,
+        'state': r.state,
+        'players': len(r.players),
+        'max_players': r.settings['max_players'],
+        'rule_set': r.settings.get('rule_set', DEFAULT_RULE_SET),
+        'has_password': bool(r.settings['password'])
+    } for r in found]), 200
+
+@game_bp.route('/stats', methods=['GET'])
+def get_stats():
+    return jsonify({
+        'rooms': len(rooms),
+        'invites': len(invites),
+        'evicted_invites': invites.evicted,
+        'rooms_expiry': reaper.stats(),
+        'backplane': backplane.stats(),
+        'journal': journal.stats(),
+        'identity_cache': identity_cache.stats(),
+        'password_hasher': password_hasher.stats(),
+        'matchmaking': matchmaker.stats(),
+        'round_timers': round_timer.stats()
+    }), 200
+
+@game_bp.route('/peer_stats', methods=['GET'])
+def get_peer_stats():
+    return jsonify(peer_client.stats()), 200
+
+@game_bp.route('/rules', methods=['GET'])
+def list_rule_sets():
+    return jsonify({'default': DEFAULT_RULE_SET, 'rule_sets': [r.describe() for r in RULE_SETS.values()]}), 200
 
 # --- Room Management ---
 
@@ -44,31 +237,133 @@ def create_room():
     max_players = data.get('max_players', 2)
     best_of = data.get('best_of', 1)
     password = data.get('password', '')
-    
-    game_id = str(uuid.uuid4())
-    
-    games[game_id] = {
-        'host': current_user.username,
-        'state': 'lobby',
-        'settings': {
-            'max_players': int(max_players),
-            'best_of': int(best_of),
-            'password': password
-        },
-        'players': {
-            current_user.username: {
-                'status': 'ready', # Host is always conceptually ready or manually sets it? Let's say Host must click Start.
-                'score': 0,
-                'move': None,
-                'ip': request.remote_addr,
-                'joined_at': time.time()
-            }
-        },
-        'current_round': 1,
-        'last_event': {'type': 'room_created', 'timestamp': time.time()}
+    rule_set = data.get('rule_set', DEFAULT_RULE_SET)
+    move_timeout = data.get('move_timeout', 0)
+    timeout_policy = data.get('timeout_policy', 'forfeit')
+    bot_strategies = data.get('bots', [])
+    # 'bots' is a list of strategy names, or a count of markov bots
+    if isinstance(bot_strategies, int):
+        if not 0 <= bot_strategies <= MAX_BOTS:
+            return jsonify({'error': f'bots must be between 0 and {MAX_BOTS}'}), 400
+        bot_strategies = ['markov'] * bot_strategies
+
+    if rule_set not in RULE_SETS:
+        return jsonify({'error': f'Unknown rule set, expected one of {sorted(RULE_SETS)}'}), 400
+    try:
+        max_players, best_of, move_timeout = int(max_players), int(best_of), float(move_timeout or 0)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid settings'}), 400
+    if not 0 <= move_timeout <= MAX_MOVE_TIMEOUT:
+        return jsonify({'error': f'move_timeout must be between 0 (none) and {MAX_MOVE_TIMEOUT} seconds'}), 400
+    if timeout_policy not in TIMEOUT_POLICIES:
+        return jsonify({'error': f'timeout_policy must be one of {TIMEOUT_POLICIES}'}), 400
+    if not 2 <= max_players <= MAX_ROOM_PLAYERS:
+        return jsonify({'error': f'max_players must be between 2 and {MAX_ROOM_PLAYERS}'}), 400
+    if not isinstance(bot_strategies, list) or any(s not in BOT_STRATEGIES for s in bot_strategies):
+        return jsonify({'error': f'bots must be a count or a list of {BOT_STRATEGIES}'}), 400
+    if len(bot_strategies) > MAX_BOTS:
+        return jsonify({'error': f'At most {MAX_BOTS} bots per room'}), 400
+    if len(bot_strategies) + 1 > max_players:
+        return jsonify({'error': 'Too many bots for max_players'}), 400
+    
+    room = new_room(current_user.username, request.remote_addr, {
+        'max_players': max_players,
+        'best_of': best_of,
+        'password': password,
+        'rule_set': rule_set,
+        'move_timeout': move_timeout,
+        'timeout_policy': timeout_policy
+    }, bot_strategies)
+    
+    return jsonify({'game_id': room.game_id, 'message': 'Room created'}), 200
+
+def new_room(host, host_ip, settings, bot_strategies=(), guests=(), game_id=None):
+    # Builds and opens a lobby room; `guests` are (username, ip) seated
+    # alongside the host, not ready
+    game_id = game_id or backplane.new_game_id() # a uuid owned by this shard
+    
+    room = Room(game_id, host, settings)
+    # Host is always conceptually ready or manually sets it? Let's say Host must click Start.
+    room.players[host] = PlayerState(host, host_ip, status='ready')
+    for username, ip in guests:
+        room.players[username] = PlayerState(username, ip)
+    room.last_event = {'type': 'room_created', 'timestamp': time.time()}
+    if bot_strategies:
+        seat_bots(room, bot_strategies)
+    open_room(room)
+    return room
+
+def matched(queue, tickets):
+    # MatchQueue callback: seats a formed group in a new room, hosted by
+    # whoever waited longest. Sharded, the queue runs on shard 0 only, so
+    # the room goes to a random shard: its id is minted for that shard and
+    # the room is opened there over the backplane (here if the hand-off
+    # fails).
+    rule_set, max_players = queue
+    host = min(tickets, key=lambda t: t.enqueued_at)
+    settings = {
+        'max_players': max_players,
+        'best_of': MATCH_BEST_OF,
+        'password': '',
+        'rule_set': rule_set,
+        'move_timeout': MATCH_MOVE_TIMEOUT,
+        'timeout_policy': 'forfeit'
     }
-    
-    return jsonify({'game_id': game_id, 'message': 'Room created'}), 200
+    guests = [(t.username, t.ip) for t in tickets if t is not host]
+    shard = random.randrange(backplane.shards)
+    if shard != backplane.shard_id:
+        game_id = backplane.new_game_id(shard)
+        if backplane.send(shard, 'match', {'game_id': game_id, 'host': [host.username, host.ip],
+                                           'settings': settings, 'guests': guests}):
+            return game_id
+    return new_room(host.username, host.ip, settings, guests=guests).game_id
+
+def open_match(msg):
+    # A match formed on shard 0, for a room id this shard owns
+    new_room(*msg['host'], msg['settings'], guests=[tuple(g) for g in msg['guests']], game_id=msg['game_id'])
+
+matchmaker = MatchQueue(on_match=matched)
+backplane.on('match', open_match)
+
+@game_bp.route('/matchmaking', methods=['POST'])
+@login_required
+def join_matchmaking():
+    # {'rule_set': ..., 'max_players': n}; poll GET for the resulting game_id
+    data = request.json or {}
+    rule_set = data.get('rule_set', DEFAULT_RULE_SET)
+    if rule_set not in RULE_SETS:
+        return jsonify({'error': f'Unknown rule set, expected one of {sorted(RULE_SETS)}'}), 400
+    try:
+        max_players = int(data.get('max_players', 2))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid settings'}), 400
+    if not 2 <= max_players <= MATCH_MAX_PLAYERS:
+        return jsonify({'error': f'max_players must be between 2 and {MATCH_MAX_PLAYERS}'}), 400
+
+    entry = leaderboard.entry(current_user.username) or {'wins': 0, 'losses': 0, 'draws': 0}
+    matchmaker.enqueue(current_user.username, request.remote_addr,
+                       rating(entry['wins'], entry['losses'], entry['draws']), rule_set, max_players)
+    return jsonify(matchmaker.status(current_user.username)), 202
+
+@game_bp.route('/matchmaking', methods=['GET'])
+@login_required
+def matchmaking_status():
+    # {'status': 'queued' | 'matched' (with game_id) | 'idle'}
+    return jsonify(matchmaker.status(current_user.username)), 200
+
+@game_bp.route('/matchmaking', methods=['DELETE'])
+@login_required
+def leave_matchmaking():
+    if not matchmaker.cancel(current_user.username):
+        return jsonify({'error': 'Not in queue'}), 404
+    return jsonify({'message': 'Left queue'}), 200
+
+def seat_bots(room, strategies):
+    rules = room_rules(room)
+    for i, strategy in enumerate(strategies, start=1):
+        bot = Bot(bot_name(strategy, i), strategy, rules)
+        room.bots[bot.name] = bot
+        room.players[bot.name] = PlayerState(bot.name, None, status='ready', bot=True)
 
 @game_bp.route('/remote_join', methods=['POST'])
 def remote_join():
@@ -82,30 +377,24 @@ def remote_join():
     if not (game_id and username and ip):
          return jsonify({'error': 'Missing data'}), 400
          
-    if game_id not in games:
+    room = rooms.get(game_id)
+    if not room:
         return jsonify({'error': 'Room not found'}), 404
     
-    game = games[game_id]
-    
-    if game['settings']['password'] and game['settings']['password'] != password:
-        return jsonify({'error': 'Invalid password'}), 403
-        
-    if len(game['players']) >= game['settings']['max_players']:
-        return jsonify({'error': 'Room full'}), 400
+    with room.lock:
+        if room.settings['password'] and room.settings['password'] != password:
+            return jsonify({'error': 'Invalid password'}), 403
+            
+        if len(room.players) >= room.settings['max_players']:
+            return jsonify({'error': 'Room full'}), 400
+            
+        if room.state != 'lobby':
+            return jsonify({'error': 'Game already in progress'}), 400
+
+        # Add Player
+        rooms.add_player(room, PlayerState(username, ip))
         
-    if game['state'] != 'lobby':
-        return jsonify({'error': 'Game already in progress'}), 400
-
-    # Add Player
-    game['players'][username] = {
-        'status': 'not_ready',
-        'score': 0,
-        'move': None,
-        'ip': ip,
-        'joined_at': time.time()
-    }
-    
-    game['last_event'] = {'type': 'player_joined', 'user': username, 'timestamp': time.time()}
+        publish(room, {'type': 'player_joined', 'user': username, 'timestamp': time.time()})
     
     return jsonify({'message': 'Joined room', 'game_id': game_id}), 200
 
@@ -118,7 +407,6 @@ def proxy_join():
     game_id = data.get('game_id')
     password = data.get('password')
     
-    target_url = f"http://{host_ip}:5001/api/game/remote_join"
     payload = {
         'game_id': game_id,
         'username': current_user.username,
@@ -127,7 +415,7 @@ def proxy_join():
     }
     
     try:
-        resp = requests.post(target_url, json=payload, timeout=5)
+        resp = peer_client.post(host_ip, '/api/game/remote_join', payload, timeout=5)
         if resp.status_code == 200:
             return jsonify(resp.json()), 200
         else:
@@ -142,18 +430,24 @@ def remote_ready():
     game_id = data.get('game_id')
     username = data.get('username')
     
-    if game_id not in games: return jsonify({'error': 'Game not found'}), 404
-    game = games[game_id]
-    
-    if username not in game['players']:
-        return jsonify({'error': 'Not in room'}), 403
+    room = rooms.get(game_id)
+    if not room: return jsonify({'error': 'Game not found'}), 404
+    return toggle_player_ready(room, username)
+
+# Game actions take the acting username explicitly and return (payload, status)
+# instead of a Flask response, so the HTTP routes and the WebSocket channel
+# (asgi.py) share them. Flask serializes the returned dicts.
+
+def toggle_player_ready(room, username):
+    with room.lock:
+        player = room.players.get(username)
+        if player is None:
+            return {'error': 'Not in room'}, 403
+            
+        player.status = 'ready' if player.status == 'not_ready' else 'not_ready'
         
-    current_status = game['players'][username]['status']
-    new_status = 'ready' if current_status == 'not_ready' else 'not_ready'
-    game['players'][username]['status'] = new_status
-    
-    game['last_event'] = {'type': 'ready_update', 'user': username, 'status': new_status, 'timestamp': time.time()}
-    return jsonify({'status': new_status}), 200
+        publish(room, {'type': 'ready_update', 'user': username, 'status': player.status, 'timestamp': time.time()})
+        return {'status': player.status}, 200
 
 @game_bp.route('/proxy_ready', methods=['POST'])
 @login_required
@@ -162,17 +456,26 @@ def proxy_ready():
     host_ip = data.get('host_ip')
     game_id = data.get('game_id')
     
-    target_url = f"http://{host_ip}:5001/api/game/remote_ready"
     payload = {
         'game_id': game_id,
         'username': current_user.username
     }
     
+    # Fire and forget on the peer pool, the result reaches the client
+    # through the host room's event stream. A failure can't reach the
+    # client any more, so it is logged (exceptions also count in /peer_stats).
+    future = peer_client.submit(host_ip, '/api/game/remote_ready', payload, timeout=2)
+    future.add_done_callback(lambda f: log_peer_failure(f, f'remote_ready to {host_ip}'))
+    return jsonify({'message': 'Toggled'}), 202
+
+def log_peer_failure(future, what):
     try:
-        requests.post(target_url, json=payload, timeout=2)
-        return jsonify({'message': 'Toggled'}), 200
+        resp = future.result()
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        print(f'{what} failed: {e}')
+        return
+    if resp.status_code >= 400:
+        print(f'{what} failed: HTTP {resp.status_code} {resp.text[:200]}')
 
 @game_bp.route('/join_room', methods=['POST'])
 @login_required
@@ -188,60 +491,57 @@ def join_room():
 @game_bp.route('/<game_id>/leave', methods=['POST'])
 @login_required
 def leave_room(game_id):
-    if game_id in games:
-        if current_user.username in games[game_id]['players']:
-            del games[game_id]['players'][current_user.username]
-            # If host left, maybe destroy room or assign new host? For now destroy if empty or host leaves
-            if len(games[game_id]['players']) == 0 or current_user.username == games[game_id]['host']:
-                del games[game_id]
-            else:
-                 games[game_id]['last_event'] = {'type': 'player_left', 'user': current_user.username, 'timestamp': time.time()}
+    room = rooms.get(game_id)
+    if room:
+        with room.lock:
+            if current_user.username in room.players:
+                rooms.remove_player(room, current_user.username)
+                # If host left, maybe destroy room or assign new host? For now destroy if empty or host leaves
+                if len(room.players) == len(room.bots) or current_user.username == room.host:
+                    close_room(game_id)
+                else:
+                     publish(room, {'type': 'player_left', 'user': current_user.username, 'timestamp': time.time()})
                  
     return jsonify({'message': 'Left room'}), 200
 
 @game_bp.route('/<game_id>/ready', methods=['POST'])
 @login_required
 def toggle_ready(game_id):
-    if game_id not in games: return jsonify({'error': 'Game not found'}), 404
-    game = games[game_id]
-    
-    if current_user.username not in game['players']:
-        return jsonify({'error': 'Not in room'}), 403
-        
-    # Toggle
-    current_status = game['players'][current_user.username]['status']
-    new_status = 'ready' if current_status == 'not_ready' else 'not_ready'
-    game['players'][current_user.username]['status'] = new_status
-    
-    game['last_event'] = {'type': 'ready_update', 'user': current_user.username, 'status': new_status, 'timestamp': time.time()}
-    
-    return jsonify({'status': new_status}), 200
+    room = rooms.get(game_id)
+    if not room: return jsonify({'error': 'Game not found'}), 404
+    return toggle_player_ready(room, current_user.username)
 
 @game_bp.route('/<game_id>/start', methods=['POST'])
 @login_required
 def start_game(game_id):
-    if game_id not in games: return jsonify({'error': 'Game not found'}), 404
-    game = games[game_id]
-    
-    if game['host'] != current_user.username:
-        return jsonify({'error': 'Only host can start'}), 403
-        
-    # Check all ready
-    if len(game['players']) < 2:
-         return jsonify({'error': 'Need at least 2 players'}), 400
-         
-    for p_name, p_data in game['players'].items():
-        if p_name != game['host'] and p_data['status'] != 'ready':
-             return jsonify({'error': f'{p_name} is not ready'}), 400
+    room = rooms.get(game_id)
+    if not room: return jsonify({'error': 'Game not found'}), 404
+    
+    with room.lock:
+        if room.host != current_user.username:
+            return jsonify({'error': 'Only host can start'}), 403
+        # A finished room isn't replayed: its game_id is already the match id in history
+        if room.state != 'lobby':
+            return jsonify({'error': 'Game already started'}), 409
+            
+        # Check all ready
+        if len(room.players) < 2:
+             return jsonify({'error': 'Need at least 2 players'}), 400
              
-    game['state'] = 'active'
-    game['current_round'] = 1
-    # Reset scores just in case
-    for p in game['players'].values():
-        p['score'] = 0
-        p['move'] = None
-        
-    game['last_event'] = {'type': 'game_start', 'timestamp': time.time()}
+        for p_name, p in room.players.items():
+            if p_name != room.host and p.status != 'ready':
+                 return jsonify({'error': f'{p_name} is not ready'}), 400
+                 
+        rooms.set_state(room, 'active')
+        room.current_round = 1
+        room.rounds = []
+        # Reset scores just in case
+        for p in room.players.values():
+            p.score = 0
+            p.move = None
+        round_timer.arm(room)
+            
+        publish(room, {'type': 'game_start', 'deadline': room.deadline, 'timestamp': time.time()})
     
     return jsonify({'message': 'Game started'}), 200
 
@@ -250,60 +550,69 @@ def start_game(game_id):
 @game_bp.route('/<game_id>/move', methods=['POST'])
 @login_required
 def submit_move(game_id):
-    if game_id not in games: return jsonify({'error': 'Game not found'}), 404
-    game = games[game_id]
+    room = rooms.get(game_id)
+    if not room: return jsonify({'error': 'Game not found'}), 404
     
     move = request.json.get('move')
     if not move: return jsonify({'error': 'No move provided'}), 400
-    
-    if current_user.username not in game['players']:
-        return jsonify({'error': 'Not in game'}), 403
+    return play_move(room, current_user.username, move)
+
+def play_move(room, username, move):
+    move = room_rules(room).canonical(move)
+    if move is None: return {'error': 'Invalid move'}, 400
+    
+    # Held across the all-moved check and resolution, so two simultaneous
+    # final moves can't both resolve (or both miss) the round
+    with room.lock:
+        player = room.players.get(username)
+        if player is None:
+            return {'error': 'Not in game'}, 403
+        if room.state != 'active':
+            return {'error': 'Game not in progress'}, 409
+            
+        player.move = move
+
+        # Bots answer as soon as the last human has moved
+        if room.bots and all(p.move is not None for name, p in room.players.items() if name not in room.bots):
+            for bot in room.bots.values():
+                room.players[bot.name].move = bot.play()
         
-    game['players'][current_user.username]['move'] = move
-    
-    # Check if all moved
-    all_moved = all(p['move'] is not None for p in game['players'].values())
-    
-    if all_moved:
-        # Resolve Round
-        resolve_round(game)
-    else:
-        # Just notify someone moved (generic)
-        game['last_event'] = {'type': 'move_submitted', 'user': current_user.username, 'timestamp': time.time()}
+        # Check if all moved
+        all_moved = all(p.move is not None for p in room.players.values())
+        
+        if all_moved:
+            # Resolve Round
+            resolve_round(room)
+        else:
+            # Just notify someone moved (generic)
+            publish(room, {'type': 'move_submitted', 'user': username, 'timestamp': time.time()})
         
-    return jsonify({'message': 'Move submitted'}), 200
+    return {'message': 'Move submitted'}, 200
 
-def resolve_round(game):
+def resolve_round(room, forfeited=()):
+    # Caller holds room.lock
     # Logic: 
     # For each player, compare with every other player.
     # Win = +1 pt, Draw/Loss = 0.
-    
-    round_results = {} # {username: {score_delta: 0, beats: []}}
-    
-    players = list(game['players'].keys())
-    # Reset deltas
-    for p in players: round_results[p] = {'score_delta': 0, 'wins_against': []}
-    
-    # Pairwise comparison
-    for i in range(len(players)):
-        p1 = players[i]
-        move1 = game['players'][p1]['move']
-        
-        for j in range(i + 1, len(players)):
-            p2 = players[j]
-            move2 = game['players'][p2]['move']
-            
-            res = get_result(move1, move2)
-            if res == 'win':
-                round_results[p1]['score_delta'] += 1
-                round_results[p1]['wins_against'].append(p2)
-            elif res == 'lose':
-                round_results[p2]['score_delta'] += 1
-                round_results[p2]['wins_against'].append(p1)
-                
+    # `forfeited` players had no move at the deadline: they score nothing
+    # and count as beaten by everyone who did move.
+    round_timer.cancel(room)
+    rules = room_rules(room)
+    players = list(room.players.keys())
+    movers = [p for p in players if p not in forfeited]
+    codes = [rules.encode(room.players[p].move) for p in movers]
+    round_results = rules.resolve(movers, codes) if movers else {} # {username: {score_delta: 0, wins_against: []}}
+    if forfeited:
+        for p in movers:
+            result = round_results[p]
+            result['score_delta'] += len(forfeited)
+            result['wins_against'] = result['wins_against'] + list(forfeited) # lists are shared per move
+        for p in forfeited:
+            round_results[p] = {'score_delta': 0, 'wins_against': []}
+
     # Apply results
     for p in players:
-        game['players'][p]['score'] += round_results[p]['score_delta']
+        room.players[p].score += round_results[p]['score_delta']
         
     # Check Game Over (Best of N rounds)
     # Actually wait. Standard Best of N is usually "First to N wins". 
@@ -311,78 +620,193 @@ def resolve_round(game):
     # User said "3局2胜" (Best of 3, 2 wins). That implies 1v1.
     # For 4 players, let's stick to "Play N rounds".
     
-    is_game_over = game['current_round'] >= game['settings']['best_of']
+    is_game_over = room.current_round >= room.settings['best_of']
     
     event_type = 'game_over' if is_game_over else 'round_over'
     
-    game['last_event'] = {
+    last_event = {
         'type': event_type, 
-        'round': game['current_round'],
+        'round': room.current_round,
         'results': round_results, # detailed results for this round
-        'moves': {p: game['players'][p]['move'] for p in players}, # Reveal moves
-        'scores': {p: game['players'][p]['score'] for p in players},
+        'moves': {p: room.players[p].move for p in players}, # Reveal moves
+        'scores': {p: room.players[p].score for p in players},
         'timestamp': time.time()
     }
+    if forfeited:
+        last_event['forfeited'] = list(forfeited)
+    for bot in room.bots.values():
+        bot.observe(last_event['moves'])
+    room.rounds.append((room.current_round, {p: room.players[p].move for p in movers},
+                        {p: r['score_delta'] for p, r in round_results.items()}))
     
     if is_game_over:
-        game['state'] = 'finished'
-        # Update Leaderboard DB
-        with db.session.no_autoflush:
-            for p_name in players:
-                user_db = User.query.filter_by(username=p_name).first()
-                if user_db:
-                    # Very simple logic: Winner is max score. If tie, multiple winners.
-                    max_score = max(p['score'] for p in game['players'].values())
-                    my_score = game['players'][p_name]['score']
-                    
-                    if my_score == max_score and my_score > 0:
-                        user_db.wins += 1
-                    else:
-                        user_db.losses += 1 # Or split into 2nd/3rd place? Keep simple.
-            db.session.commit()
+        rooms.set_state(room, 'finished')
+        # Update Leaderboard: in memory now, DB write-behind (services/results.py)
+        outcome = game_outcome(last_event['scores'])
+        leaderboard.record(outcome)
+        backplane.broadcast('leaderboard', outcome)
+        result_writer.submit(outcome, {
+            'id': room.game_id,
+            'host': room.host,
+            'rule_set': room.settings.get('rule_set', DEFAULT_RULE_SET),
+            'scores': last_event['scores'],
+            'rounds': room.rounds,
+            'finished_at': last_event['timestamp']
+        })
     else:
         # Prepare next round
-        game['current_round'] += 1
-        for p in game['players'].values():
-            p['move'] = None
+        room.current_round += 1
+        for p in room.players.values():
+            p.move = None
+        round_timer.arm(room)
+        last_event['deadline'] = room.deadline
 
-def get_result(m1, m2):
-    # m1 vs m2
-    if m1 == m2: return 'draw'
-    
-    # Moves list for simple lookup or standard rules
-    # Rock, Paper, Scissors, Lizard, Spock
-    beats = {
-        'rock': ['scissors', 'lizard'],
-        'paper': ['rock', 'spock'],
-        'scissors': ['paper', 'lizard'],
-        'lizard': ['spock', 'paper'],
-        'spock': ['rock', 'scissors']
-    }
-    
-    if m2 in beats.get(m1, []): return 'win'
-    return 'lose'
+    # Publish once the room is in its post-round state so waiters see it whole
+    publish(room, last_event)
+
+def round_timed_out(room):
+    # RoundTimer callback, caller holds room.lock. Bots always answer; idle
+    # players forfeit the round or, with timeout_policy 'random', get a
+    # random move played for them.
+    for bot in room.bots.values():
+        if room.players[bot.name].move is None:
+            room.players[bot.name].move = bot.play()
+    idle = [name for name, p in room.players.items() if p.move is None]
+    if room.settings.get('timeout_policy') == 'random':
+        moves = room_rules(room).moves
+        for name in idle:
+            room.players[name].move = random.choice(moves)
+        idle = []
+    resolve_round(room, forfeited=idle)
+
+round_timer = RoundTimer(rooms, on_expire=round_timed_out)
 
 @game_bp.route('/<game_id>/state', methods=['GET'])
 @login_required
 def get_game_state(game_id):
-    if game_id not in games: return jsonify({'error': 'Game not found'}), 404
-    return jsonify(games[game_id]), 200
+    # Supports conditional GET (If-None-Match) and long-polling:
+    #   ?since=<version>&wait=<seconds> blocks until the room passes `since`
+    room = rooms.get(game_id)
+    if not room: return jsonify({'error': 'Game not found'}), 404
+    feed = room.feed
+
+    since = request.args.get('since', type=int)
+    wait = request.args.get('wait', 0, type=float)
+    if since is not None and wait > 0:
+        feed.wait(since, wait)
+        if feed.closed: return jsonify({'error': 'Game not found'}), 404
+
+    etag = feed.etag()
+    if request.if_none_match.contains(etag) or (since is not None and feed.version <= since):
+        resp = Response(status=304)
+    else:
+        with room.lock:
+            # Players see each other's LAN addresses, other users don't
+            body = feed.encode(room, spectator=current_user.username not in room.players)
+        resp = Response(body, mimetype='application/json')
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+@game_bp.route('/<game_id>/events', methods=['GET'])
+@login_required
+def stream_events(game_id):
+    # Server-Sent Events: ordered room events, resumable via Last-Event-ID
+    room = rooms.get(game_id)
+    if not room: return jsonify({'error': 'Game not found'}), 404
+    feed = room.feed
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('since', feed.version, type=int)
+
+    def stream(last_id):
+        yield f'retry: {SSE_RETRY_MS}\n\n'
+        while True:
+            frames, complete = feed.frames_since(last_id)
+            if not complete:
+                # Missed events fell out of the buffer, client must refetch /state
+                last_id = feed.version
+                yield f'id: {last_id}\ndata: {{"type": "resync", "id": {last_id}}}\n\n'
+                continue
+            if frames:
+                last_id += len(frames)
+                yield ''.join(frames)
+                continue
+            if feed.closed:
+                yield 'data: {"type": "room_closed"}\n\n'
+                return
+            if feed.wait(last_id, SSE_HEARTBEAT) == last_id and not feed.closed:
+                yield ': ping\n\n'
+
+    resp = Response(stream_with_context(stream(last_id)), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
+def spectator_state_frame(version, view):
+    # First frame of a spectator stream: the public room view at `version`
+    return f'id: {version}\ndata: {{"type": "state", "room": {view.decode()}}}\n\n'
+
+@game_bp.route('/<game_id>/spectate', methods=['GET'])
+def spectate(game_id):
+    # Read-only SSE for viewers who aren't in the room, no login needed:
+    # the public room view, then every room event. A viewer that falls
+    # more than the event buffer behind is dropped, never resynced. Each
+    # viewer holds a thread here; asgi.py serves large audiences.
+    room = rooms.get(game_id)
+    if not room: return jsonify({'error': 'Game not found'}), 404
+    feed = room.feed
+    with room.lock:
+        last_id = feed.version
+        view = feed.encode(room, spectator=True)
+
+    def stream(last_id):
+        yield f'retry: {SSE_RETRY_MS}\n\n' + spectator_state_frame(last_id, view)
+        while True:
+            frames, complete = feed.frames_since(last_id)
+            if not complete:
+                yield 'data: {"type": "dropped"}\n\n'
+                return
+            if frames:
+                last_id += len(frames)
+                yield ''.join(frames)
+                continue
+            if feed.closed:
+                yield 'data: {"type": "room_closed"}\n\n'
+                return
+            if feed.wait(last_id, SSE_HEARTBEAT) == last_id and not feed.closed:
+                yield ': ping\n\n'
+
+    resp = Response(stream_with_context(stream(last_id)), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
+@game_bp.route('/<game_id>/replay', methods=['GET'])
+@login_required
+def replay_events(game_id):
+    # A room's full event history from the journal, also after it closed
+    events = journal.history(game_id)
+    if not events: return jsonify({'error': 'No history for this game'}), 404
+    return jsonify(events), 200
 
 @game_bp.route('/<game_id>/emote', methods=['POST'])
 @login_required
 def send_emote(game_id):
-    if game_id not in games: return jsonify({'error': 'Game not found'}), 404
-    game = games[game_id]
+    room = rooms.get(game_id)
+    if not room: return jsonify({'error': 'Game not found'}), 404
     
-    emote_id = request.json.get('emoteId')
-    game['last_event'] = {
-        'type': 'emote',
-        'sender': current_user.username,
-        'emoteId': emote_id,
-        'timestamp': time.time()
-    }
-    return jsonify({'message': 'Emote sent'}), 200
+    return send_room_emote(room, current_user.username, request.json.get('emoteId'))
+
+def send_room_emote(room, username, emote_id):
+    with room.lock:
+        publish(room, {
+            'type': 'emote',
+            'sender': username,
+            'emoteId': emote_id,
+            'timestamp': time.time()
+        })
+    return {'message': 'Emote sent'}, 200
 
 # Legacy/Discovery Support (Modified for Rooms)
 # Allow inviting to a specific room
@@ -399,24 +823,22 @@ def receive_invite():
     if not (target_user and from_user and from_ip and game_id):
         return jsonify({'error': 'Missing data'}), 400
         
-    if target_user not in invites:
-        invites[target_user] = []
-    
-    invites[target_user].append({
+    invite = {
         'from_user': from_user,
         'from_ip': from_ip,
         'game_id': game_id,
         'has_password': has_password,
         'timestamp': time.time()
-    })
+    }
+    invites.add(target_user, invite)
+    backplane.broadcast('invite', {'target_user': target_user, 'invite': invite})
     
     return jsonify({'message': 'Invite received'}), 200
 
 @game_bp.route('/invites', methods=['GET'])
 @login_required
 def get_invites():
-    my_invites = invites.get(current_user.username, [])
-    # Cleanup old?
+    my_invites = invites.get(current_user.username) # Expired ones are swept, see InviteStore
     return jsonify(my_invites), 200
 
 @game_bp.route('/challenge', methods=['POST'])
@@ -433,31 +855,18 @@ def send_challenge():
     password = data.get('password', '')
     
     # 1. Create Room
-    game_id = str(uuid.uuid4())
-    games[game_id] = {
-        'host': current_user.username,
-        'state': 'lobby',
-        'settings': {
-            'max_players': 2,
-            'best_of': 1, # Default 1v1
-            'password': password
-        },
-        'players': {
-            current_user.username: {
-                'status': 'ready',
-                'score': 0,
-                'move': None,
-                'ip': request.remote_addr,
-                'joined_at': time.time()
-            }
-        },
-        'current_round': 1,
-        'last_event': None
-    }
+    game_id = backplane.new_game_id()
+    room = Room(game_id, current_user.username, {
+        'max_players': 2,
+        'best_of': 1, # Default 1v1
+        'password': password,
+        'rule_set': DEFAULT_RULE_SET
+    })
+    room.players[current_user.username] = PlayerState(current_user.username, request.remote_addr, status='ready')
+    open_room(room)
     
     # 2. Send Invite
     try:
-        target_url = f"http://{target_ip}:5001/api/game/invite"
         payload = {
             'target_user': target_username,
             'from_user': current_user.username,
@@ -465,18 +874,54 @@ def send_challenge():
             'game_id': game_id,
             'has_password': bool(password)
         }
-        requests.post(target_url, json=payload, timeout=2)
+        peer_client.post(target_ip, '/api/game/invite', payload, timeout=2)
     except Exception as e:
-        del games[game_id]
+        close_room(game_id)
         return jsonify({'error': f'Failed: {str(e)}'}), 500
         
     return jsonify({'game_id': game_id, 'message': 'Challenge sent'}), 200
 
+@game_bp.route('/<game_id>/invite_many', methods=['POST'])
+@login_required
+def invite_many(game_id):
+    # Invite a list of LAN peers ({'peers': [{'ip': ..., 'username': ...}]})
+    # to a room at once. Calls go out concurrently on the peer client's
+    # fan-out pool and the response streams one JSON line per peer as each
+    # call completes or runs out of time.
+    room = rooms.get(game_id)
+    if not room: return jsonify({'error': 'Game not found'}), 404
+    if room.host != current_user.username:
+        return jsonify({'error': 'Only host can invite'}), 403
+
+    peers = request.json.get('peers') or []
+    if not isinstance(peers, list) or not all(isinstance(p, dict) and p.get('ip') and p.get('username') for p in peers):
+        return jsonify({'error': 'peers must be a list of {ip, username}'}), 400
+
+    from_ip = request.remote_addr
+    calls = [(peer['ip'], '/api/game/invite', {
+        'target_user': peer['username'],
+        'from_user': current_user.username,
+        'from_ip': from_ip,
+        'game_id': game_id,
+        'has_password': bool(room.settings['password'])
+    }) for peer in peers]
+
+    def stream():
+        for i, resp, error in peer_client.fan_out(calls, timeout=INVITE_TIMEOUT):
+            result = {'ip': peers[i]['ip'], 'username': peers[i]['username']}
+            if error is None:
+                result.update(ok=resp.status_code == 200, status=resp.status_code)
+            else:
+                result.update(ok=False, error=str(error) or type(error).__name__)
+            yield json.dumps(result) + '\n'
+
+    return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+
 @game_bp.route('/<game_id>/accept', methods=['POST']) # Renaming for clarity if needed, but keeping compat?
 @login_required
 def accept_invite(game_id):
     
-    game = games[game_id]
+    game = rooms.get(game_id).to_dict()
     response = {
         'state': game['state'],
         'host': game['host'],
@@ -0,0 +1,70 @@
+from flask import Blueprint, request, jsonify
+from sqlalchemy import tuple_
+
+from models import db, Match, MatchPlayer, RoundResult, MoveStat, HeadToHead
+
+history_bp = Blueprint('history', __name__)
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Finished games are written by ResultWriter shortly after game over, so a
+# match shows up here within one flush interval.
+
+def match_summaries(match_ids):
+    # {match_id: summary} with every player's score and result, two IN queries
+    matches = {m.id: {'game_id': m.id, 'host': m.host, 'rule_set': m.rule_set, 'rounds': m.rounds,
+                      'finished_at': m.finished_at, 'players': {}}
+               for m in Match.query.filter(Match.id.in_(match_ids))}
+    for p in MatchPlayer.query.filter(MatchPlayer.match_id.in_(match_ids)):
+        matches[p.match_id]['players'][p.username] = {'score': p.score, 'result': p.result}
+    return matches
+
+@history_bp.route('/users/<username>', methods=['GET'])
+def user_history(username):
+    # Latest matches first, keyset-paginated: pass the returned `next`
+    # cursor as ?before= to continue, so deep pages cost the same as the first
+    limit = min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    query = db.session.query(MatchPlayer.match_id, MatchPlayer.finished_at).filter(MatchPlayer.username == username)
+    before = request.args.get('before')
+    if before:
+        try:
+            finished_at, match_id = before.split(':', 1)
+            query = query.filter(tuple_(MatchPlayer.finished_at, MatchPlayer.match_id) < (float(finished_at), match_id))
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    rows = query.order_by(MatchPlayer.finished_at.desc(), MatchPlayer.match_id.desc()).limit(limit).all()
+
+    summaries = match_summaries([r.match_id for r in rows])
+    last = rows[-1] if len(rows) == limit else None
+    return jsonify({
+        'matches': [summaries[r.match_id] for r in rows],
+        'next': f'{last.finished_at!r}:{last.match_id}' if last else None
+    }), 200
+
+@history_bp.route('/matches/<game_id>', methods=['GET'])
+def match_detail(game_id):
+    summary = match_summaries([game_id]).get(game_id)
+    if summary is None: return jsonify({'error': 'Match not found'}), 404
+    rounds = {}
+    for r in RoundResult.query.filter_by(match_id=game_id).order_by(RoundResult.round):
+        entry = rounds.setdefault(r.round, {'round': r.round, 'moves': {}, 'score_deltas': {}})
+        entry['moves'][r.username] = r.move
+        entry['score_deltas'][r.username] = r.score_delta
+    summary['round_results'] = list(rounds.values())
+    return jsonify(summary), 200
+
+@history_bp.route('/users/<username>/stats', methods=['GET'])
+def user_stats(username):
+    # Precomputed aggregates: move frequency and head-to-head records,
+    # optionally for one ?opponent=
+    moves = {s.move: s.count for s in MoveStat.query.filter_by(username=username)}
+    h2h = HeadToHead.query.filter_by(username=username)
+    opponent = request.args.get('opponent')
+    if opponent:
+        h2h = h2h.filter_by(opponent=opponent)
+    return jsonify({
+        'username': username,
+        'moves': moves,
+        'head_to_head': {h.opponent: {'wins': h.wins, 'losses': h.losses, 'draws': h.draws} for h in h2h}
+    }), 200
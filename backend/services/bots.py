@@ -0,0 +1,93 @@
+import random
+from array import array
+
+import numpy as np
+
+BOT_STRATEGIES = ['random', 'frequency', 'markov']
+MAX_BOTS = 499 # Per room, every seat but the host's in the largest room
+
+class MoveHistory:
+    # What one opponent has played, as flat count arrays:
+    #   rows 0..n-1: order-1 Markov counts, counts[prev * n + next]
+    #   row n:       order-0 counts (overall move frequency)
+    # best[row] tracks each row's argmax as counts grow, so both update and
+    # predict are O(1) whatever the size of the rule set.
+    __slots__ = ('n', 'counts', 'best', 'last')
+
+    def __init__(self, n):
+        self.n = n
+        self.counts = array('I', [0]) * ((n + 1) * n)
+        self.best = array('h', [-1]) * (n + 1)
+        self.last = n
+
+    def _bump(self, row, move):
+        counts, n = self.counts, self.n
+        counts[row * n + move] += 1
+        b = self.best[row]
+        if b < 0 or counts[row * n + move] > counts[row * n + b]:
+            self.best[row] = move
+
+    def update(self, move):
+        if self.last != self.n:
+            self._bump(self.last, move)
+        self._bump(self.n, move)
+        self.last = move
+
+    def predict(self, order=1):
+        # Most likely next move, or None before anything has been seen
+        b = self.best[self.last] if order else -1
+        if b < 0:
+            b = self.best[self.n]
+        return b if b >= 0 else None
+
+class Bot:
+    # A server-side player. Keeps one MoveHistory per opponent and plays the
+    # move that beats the most predicted opponent moves.
+    def __init__(self, name, strategy, rules, seed=None):
+        self.name = name
+        self.strategy = strategy
+        self.rules = rules
+        self.rng = random.Random(seed)
+        self.histories = {} # {opponent: MoveHistory}
+        wins = rules.wins.tolist()
+        self.counters = [[a for a in range(len(rules.moves)) if wins[a][m]] for m in range(len(rules.moves))]
+
+    def choose(self):
+        n = len(self.rules.moves)
+        if self.strategy == 'random' or not self.histories:
+            return self.rng.randrange(n)
+
+        order = 1 if self.strategy == 'markov' else 0
+        predictions = [h.predict(order) for h in self.histories.values()]
+        predictions = [p for p in predictions if p is not None]
+        if not predictions:
+            return self.rng.randrange(n)
+        if len(predictions) == 1:
+            # Heads-up, the common case: any counter of the prediction
+            return self.rng.choice(self.counters[predictions[0]])
+
+        tally = np.bincount(predictions, minlength=n)
+        scores = self.rules.wins @ tally
+        return self.rng.choice(np.flatnonzero(scores == scores.max()).tolist())
+
+    def play(self):
+        return self.rules.moves[self.choose()]
+
+    def observe(self, moves):
+        # moves: {username: move name} revealed at the end of a round
+        for player, move in moves.items():
+            if player == self.name: continue
+            code = self.rules.encode(move)
+            if code is not None:
+                self.record(player, code)
+
+    def record(self, player, code):
+        history = self.histories.get(player)
+        if history is None:
+            history = self.histories[player] = MoveHistory(len(self.rules.moves))
+        history.update(code)
+
+BOT_PREFIX = 'bot:' # Reserved, registration rejects usernames starting with it
+
+def bot_name(strategy, i):
+    return f'{BOT_PREFIX}{strategy}:{i}'
@@ -0,0 +1,49 @@
+import time
+
+from services.scheduler import scheduler
+
+TIMEOUT_POLICIES = ('forfeit', 'random')
+MAX_MOVE_TIMEOUT = 3600 # Seconds
+
+class RoundTimer:
+    # Move deadlines for rooms whose settings set 'move_timeout' (seconds).
+    # Each round arms one timer on the shared scheduler heap; if it fires
+    # while the round is still open, on_expire(room) is called under the
+    # room lock to fill in the missing moves and resolve the round. A round
+    # that resolves first cancels its timer, which the scheduler then drops
+    # lazily, so a room costs one heap entry whatever its pace.
+    def __init__(self, store, on_expire):
+        self.store = store
+        self.on_expire = on_expire
+        self.fired = 0
+        self.max_late_ms = 0.0 # worst timer lateness seen, scheduler health
+
+    def arm(self, room):
+        # Caller holds room.lock, at the start of every round
+        self.cancel(room)
+        timeout = room.settings.get('move_timeout')
+        if not timeout: return
+        room.deadline = time.time() + timeout
+        room.deadline_timer = scheduler.call_later(timeout, self._expire, room.game_id, room.deadline,
+                                                   time.monotonic() + timeout)
+
+    def cancel(self, room):
+        # Caller holds room.lock
+        if room.deadline_timer is not None:
+            room.deadline_timer.cancel()
+        room.deadline = room.deadline_timer = None
+
+    def _expire(self, game_id, deadline, due):
+        late = (time.monotonic() - due) * 1000
+        room = self.store.get(game_id)
+        if room is None: return
+        with room.lock:
+            # A restart or another round since arming re-armed the room
+            if room.state != 'active' or room.deadline != deadline: return
+            room.deadline = room.deadline_timer = None
+            self.fired += 1
+            self.max_late_ms = max(self.max_late_ms, late)
+            self.on_expire(room)
+
+    def stats(self):
+        return {'fired': self.fired, 'max_late_ms': round(self.max_late_ms, 3)}
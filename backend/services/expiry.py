@@ -0,0 +1,48 @@
+import time
+from collections import Counter
+
+from services.scheduler import scheduler
+
+# Seconds a room may sit without any mutation before it is collected
+ROOM_TTL = {'lobby': 30 * 60, 'active': 10 * 60, 'finished': 2 * 60}
+DEADLINE_GRACE = 30 # Seconds a room outlives its pending move deadline
+
+class RoomReaper:
+    # Collects abandoned rooms. Each watched room has at most one pending
+    # timer on the shared scheduler heap, set for updated_at + ttl[state].
+    # Activity doesn't touch the heap: when the timer fires on a room that
+    # changed since, it is simply re-armed for the new deadline. A round
+    # with a move deadline (RoundTimer) keeps its room until that deadline
+    # has fired, however long move_timeout is.
+    def __init__(self, store, ttl=None, on_evict=None):
+        self.store = store
+        self.on_evict = on_evict
+        self.ttl = dict(ROOM_TTL, **(ttl or {}))
+        self.evicted = Counter() # {state: rooms collected}
+
+    def watch(self, room):
+        scheduler.call_later(self._deadline(room) - time.time(), self._check, room.game_id)
+
+    def _deadline(self, room):
+        deadline = room.updated_at + self.ttl.get(room.state, ROOM_TTL['lobby'])
+        if room.deadline is not None:
+            deadline = max(deadline, room.deadline + DEADLINE_GRACE)
+        return deadline
+
+    def _check(self, game_id):
+        room = self.store.get(game_id)
+        if room is None:
+            return
+        with room.lock:
+            remaining = self._deadline(room) - time.time()
+            if remaining > 0:
+                scheduler.call_later(remaining, self._check, game_id)
+                return
+            self.evicted[room.state] += 1
+            room.feed.publish(room, {'type': 'room_expired', 'timestamp': time.time()})
+            self.store.remove(game_id)
+        if self.on_evict:
+            self.on_evict(game_id)
+
+    def stats(self):
+        return {'ttl': self.ttl, 'evicted': dict(self.evicted)}
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+from services.spectators import SpectatorHub
+
+try:
+    import orjson
+except ImportError: # optional, a few times faster than json for room views
+    orjson = None
+
+MAX_WAIT = 30  # Seconds a long-poll may block before returning 304
+EVENT_BUFFER = 64  # Events kept per room for Last-Event-ID resume
+
+class RoomFeed:
+    # Per-room change counter and event log. Every mutation publishes an
+    # event and bumps `version`, so an event's id is the room version it
+    # produced. Readers can block on it (long-poll / SSE) or compare it
+    # against an ETag. Async readers (asgi.py) park a future per wait
+    # instead of a thread; publish resolves them on their own event loop.
+    # Spectators are pushed each frame through a SpectatorHub.
+    def __init__(self):
+        self.version = 0
+        self.closed = False
+        self._cond = threading.Condition()
+        self._encoded = {} # {spectator: (version, body)}
+        self._events = deque(maxlen=EVENT_BUFFER) # (id, json, sse frame)
+        self._waiters = set() # {(loop, future)} from wait_async
+        self.spectators = SpectatorHub()
+
+    def publish(self, room, event):
+        with self._cond:
+            self.version += 1
+            event['id'] = self.version
+            room.last_event = event
+            room.version = self.version
+            room.updated_at = time.time()
+            # Encode once here, every stream/socket subscriber reuses it
+            data = json.dumps(event)
+            frame = f'id: {self.version}\ndata: {data}\n\n'
+            self._events.append((self.version, data, frame))
+            self._cond.notify_all()
+            self._wake_async()
+            if self.spectators.active:
+                self.spectators.publish((self.version, frame.encode()))
+        return self.version
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+            self._wake_async()
+            self.spectators.publish(None)
+
+    def _wake_async(self):
+        # Caller holds the condition
+        for loop, future in self._waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+        self._waiters.clear()
+
+    def wait(self, since, timeout):
+        # Block until the room moves past `since`, is closed, or timeout expires
+        with self._cond:
+            self._cond.wait_for(lambda: self.version > since or self.closed, min(timeout, MAX_WAIT))
+            return self.version
+
+    async def wait_async(self, since, timeout):
+        # Awaitable form of wait(), holds no thread while parked
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._cond:
+            if self.version > since or self.closed:
+                return self.version
+            waiter = (loop, future)
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(future, min(timeout, MAX_WAIT))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._waiters.discard(waiter)
+        return self.version
+
+    def frames_since(self, last_id):
+        # Returns (SSE frames, complete). complete is False when events after
+        # last_id have already fallen out of the ring buffer.
+        return self._since(last_id, 2)
+
+    def payloads_since(self, last_id):
+        # Same as frames_since, but the bare JSON of each event (WebSocket)
+        return self._since(last_id, 1)
+
+    def _since(self, last_id, field):
+        with self._cond:
+            if last_id == self.version:
+                return [], True
+            if last_id > self.version or not self._events:
+                return [], False
+            oldest = self._events[0][0]
+            items = [event[field] for event in self._events if event[0] > last_id]
+            return items, oldest <= last_id + 1
+
+    def encode(self, room, spectator=False):
+        # Room.public_dict(spectator) as JSON bytes, built once per version
+        # and view: every poller at that version is served the same bytes
+        cached = self._encoded.get(spectator)
+        if cached and cached[0] == self.version:
+            return cached[1]
+        version = self.version
+        body = dumps(room.public_dict(spectator))
+        self._encoded[spectator] = (version, body)
+        return body
+
+    def etag(self):
+        return f'v{self.version}'
+
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
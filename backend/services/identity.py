@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+
+CACHE_SIZE = 4096
+CACHE_TTL = 60 # Seconds; bounds staleness if an invalidation is missed
+
+class SessionUser(UserMixin):
+    # What flask_login hands out as current_user: the User columns minus
+    # the password hash, detached from any DB session
+    __slots__ = ('id', 'username', 'wins', 'losses', 'draws')
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.wins = user.wins or 0
+        self.losses = user.losses or 0
+        self.draws = user.draws or 0
+
+class IdentityCache:
+    # LRU + TTL cache in front of load_user, so authenticated requests
+    # (state polls included) don't each cost a SELECT. Entries are dropped on
+    # logout and when ResultWriter changes a user's stats.
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # {user_id: (expires_at, SessionUser)}
+        self._ids = {} # {username: user_id}
+
+    def configure(self, config):
+        # Reads IDENTITY_CACHE_SIZE and IDENTITY_CACHE_TTL (0 disables caching)
+        self.size = config.get('IDENTITY_CACHE_SIZE', self.size)
+        self.ttl = config.get('IDENTITY_CACHE_TTL', self.ttl)
+
+    def get(self, user_id, load):
+        # load(user_id) -> User or None, called on a miss
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        user = load(user_id)
+        if user is None:
+            return None
+        session_user = SessionUser(user)
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, session_user)
+            self._entries.move_to_end(user_id)
+            self._ids[session_user.username] = user_id
+            while len(self._entries) > self.size:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._ids.pop(evicted.username, None)
+        return session_user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+            if entry is not None:
+                self._ids.pop(entry[1].username, None)
+
+    def invalidate_usernames(self, usernames):
+        with self._lock:
+            for username in usernames:
+                user_id = self._ids.pop(username, None)
+                if user_id is not None:
+                    self._entries.pop(user_id, None)
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+identity_cache = IdentityCache()
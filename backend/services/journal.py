@@ -0,0 +1,341 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from itertools import groupby
+
+FSYNC_INTERVAL = 0.05 # Seconds records are batched per fsync; 0 = fsync every record
+SNAPSHOT_EVERY = 10000 # Records between snapshots
+RETAIN_SEGMENTS = 8 # Segments already in the snapshot that are kept for replays
+
+SNAPSHOT_FILE = 'snapshot.json'
+
+def player_row(p):
+    return [p.status, p.score, p.move, p.ip, p.joined_at, p.bot]
+
+def track_rounds(logged, event):
+    # Keeps the mirror's 'rounds' (Room.rounds, for match history) in step
+    # with the events: reset at game start, one entry per resolved round
+    kind = event and event.get('type')
+    if kind == 'game_start':
+        logged['rounds'] = []
+    elif kind in ('round_over', 'game_over'):
+        logged.setdefault('rounds', []).append([
+            event['round'],
+            {p: m for p, m in event['moves'].items() if m is not None},
+            {p: r['score_delta'] for p, r in event['results'].items()}
+        ])
+
+class RoomJournal:
+    # Optional durability for in-memory rooms (JOURNAL_DIR). Every published
+    # room event appends one JSON line to the current log segment:
+    #   {"t": "c", "g": id, "v": version, "room": {...}}          room created
+    #   {"t": "u", "g": id, "v": version, "e": event,             mutation; only
+    #    "s": state, "r": round, "p": {user: row}, "x": [user]}   changed fields
+    #   {"t": "d", "g": id}                                       room removed
+    # The journal keeps a mirror of each room as last logged, so a mutation
+    # is logged as the diff against it and a snapshot is just a dump of the
+    # mirror (no room locks). Every SNAPSHOT_EVERY records the segment is
+    # rotated and a snapshot written; startup loads the snapshot and replays
+    # the segments after it. Each room's finished rounds are rebuilt from
+    # its round_over events. The last RETAIN_SEGMENTS segments before the
+    # snapshot are kept as match history; an index of where each room's
+    # records sit lets a replay read just those lines.
+    def __init__(self, fsync_interval=FSYNC_INTERVAL, snapshot_every=SNAPSHOT_EVERY,
+                 retain_segments=RETAIN_SEGMENTS):
+        self.dir = None
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        self.retain_segments = retain_segments
+        self.records = 0
+        self.syncs = 0
+        self.snapshots = 0
+        self._cond = threading.Condition() # mirror and _pending
+        self._writer = threading.Lock() # segment file and snapshot
+        self._mirror = {} # {game_id: room dict as logged}
+        self._pending = [] # (game_id, encoded line) not yet written
+        self._index = {} # {game_id: [(segment, offset)]} of written records, under _writer
+        self._since_snapshot = 0
+        self._segment = 0
+        self._snapshot_segment = 0 # first segment not folded into the snapshot
+        self._file = None
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self.dir is not None
+
+    def configure(self, config):
+        # Reads JOURNAL_DIR (unset = disabled), JOURNAL_FSYNC_INTERVAL,
+        # JOURNAL_SNAPSHOT_EVERY and JOURNAL_RETAIN_SEGMENTS. Sharded workers
+        # each get a subdirectory.
+        directory = config.get('JOURNAL_DIR')
+        if not directory: return
+        if config.get('SHARD_COUNT', 1) > 1:
+            directory = os.path.join(directory, f"shard-{config.get('SHARD_ID', 0)}")
+        self.dir = directory
+        self.fsync_interval = config.get('JOURNAL_FSYNC_INTERVAL', self.fsync_interval)
+        self.snapshot_every = config.get('JOURNAL_SNAPSHOT_EVERY', self.snapshot_every)
+        self.retain_segments = config.get('JOURNAL_RETAIN_SEGMENTS', self.retain_segments)
+        os.makedirs(self.dir, exist_ok=True)
+
+    # --- Recovery ---
+
+    def load(self):
+        # Rebuilds the mirror from snapshot + later segments and returns it,
+        # {game_id: room dict}. Indexes every retained segment for replays
+        # and opens a fresh segment for new records.
+        if not self.enabled: return {}
+        start = time.perf_counter()
+        first = 0
+        path = os.path.join(self.dir, SNAPSHOT_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                snapshot = json.load(f)
+            self._mirror = snapshot['rooms']
+            first = snapshot['segment']
+        segments = self._segments()
+        replayed = 0
+        for seq, segment in segments:
+            for offset, record in self._read(segment):
+                self._index.setdefault(record['g'], []).append((seq, offset))
+                if seq < first: continue
+                self._apply(record)
+                replayed += 1
+        self._segment = max([first] + [seq + 1 for seq, _ in segments])
+        self._snapshot_segment = first
+        self._open_segment()
+        self._prune()
+        if self.fsync_interval and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='journal', daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+        print(f'Journal: {len(self._mirror)} rooms from {self.dir} '
+              f'({replayed} records replayed in {(time.perf_counter() - start) * 1000:.1f} ms)')
+        return self._mirror
+
+    def _segments(self):
+        found = []
+        for path in glob.glob(os.path.join(self.dir, 'rooms-*.log')):
+            try:
+                found.append((int(os.path.basename(path)[6:-4]), path))
+            except ValueError:
+                pass
+        return sorted(found)
+
+    @staticmethod
+    def _read(path):
+        # Yields (byte offset, record) for each line
+        offset = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    yield offset, json.loads(line)
+                except ValueError:
+                    return # torn write at the tail of a crashed segment
+                offset += len(line)
+
+    def _apply(self, record):
+        game_id = record['g']
+        if record['t'] == 'd':
+            self._mirror.pop(game_id, None)
+            return
+        room = self._mirror.get(game_id)
+        if room is not None and record['v'] <= room['version']:
+            return # already in the snapshot
+        if record['t'] == 'c':
+            self._mirror[game_id] = record['room']
+            return
+        if room is None: return
+        room['version'] = record['v']
+        room['last_event'] = record.get('e')
+        track_rounds(room, room['last_event'])
+        if 's' in record: room['state'] = record['s']
+        if 'r' in record: room['round'] = record['r']
+        room['players'].update(record.get('p', {}))
+        for username in record.get('x', ()):
+            room['players'].pop(username, None)
+
+    # --- Recording ---
+
+    def record(self, room, event):
+        # Caller holds room.lock
+        if not self.enabled: return
+        with self._cond:
+            self._log(room, event)
+        if not self.fsync_interval:
+            self.flush()
+
+    def _log(self, room, event):
+        # Caller holds _cond
+        logged = self._mirror.get(room.game_id)
+        if logged is None:
+            logged = {
+                'host': room.host,
+                'settings': room.settings,
+                'state': room.state,
+                'round': room.current_round,
+                'players': {u: player_row(p) for u, p in room.players.items()},
+                'bots': {name: bot.strategy for name, bot in room.bots.items()},
+                'rounds': [list(r) for r in room.rounds],
+                'version': room.version,
+                'last_event': event
+            }
+            self._mirror[room.game_id] = logged
+            self._append({'t': 'c', 'g': room.game_id, 'v': room.version, 'room': logged})
+            return
+        record = {'t': 'u', 'g': room.game_id, 'v': room.version, 'e': event}
+        if room.state != logged['state']:
+            record['s'] = logged['state'] = room.state
+        if room.current_round != logged['round']:
+            record['r'] = logged['round'] = room.current_round
+        players = logged['players']
+        changed = {}
+        for username, p in room.players.items():
+            row = player_row(p)
+            if players.get(username) != row:
+                changed[username] = players[username] = row
+        if changed:
+            record['p'] = changed
+        if len(players) > len(room.players):
+            record['x'] = [u for u in players if u not in room.players]
+            for username in record['x']:
+                del players[username]
+        logged['version'] = room.version
+        logged['last_event'] = event
+        track_rounds(logged, event)
+        self._append(record)
+
+    def removed(self, game_id):
+        if not self.enabled: return
+        with self._cond:
+            if self._mirror.pop(game_id, None) is not None:
+                self._append({'t': 'd', 'g': game_id})
+        if not self.fsync_interval:
+            self.flush()
+
+    def _append(self, record):
+        # Caller holds _cond
+        self._pending.append((record['g'], json.dumps(record, separators=(',', ':')).encode() + b'\n'))
+        self.records += 1
+        self._since_snapshot += 1
+        if self.fsync_interval:
+            self._cond.notify()
+
+    # --- Writing ---
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+            # Let records pile up so one fsync covers them all
+            time.sleep(self.fsync_interval)
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+    def flush(self):
+        # Only the swap of _pending (and, when a snapshot is due, a copy of
+        # the mirror) happens under _cond; writing, fsync and the snapshot
+        # dump run under _writer so record() never waits on the disk
+        with self._writer:
+            with self._cond:
+                if not self._pending or self._file is None: return
+                pending, self._pending = self._pending, []
+                snapshot = None
+                if self._since_snapshot >= self.snapshot_every:
+                    snapshot = self._copy_mirror()
+                    self._since_snapshot = 0
+            offset = self._file.tell()
+            for game_id, line in pending:
+                self._index.setdefault(game_id, []).append((self._segment, offset))
+                offset += len(line)
+            self._file.write(b''.join(line for _, line in pending))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.syncs += 1
+            if snapshot is not None:
+                self._snapshot(snapshot)
+
+    def _copy_mirror(self):
+        # Caller holds _cond. Player rows are replaced rather than mutated
+        # and settings/bots never change, so only the containers are copied.
+        return {game_id: dict(room, players=dict(room['players']), rounds=list(room.get('rounds', [])))
+                for game_id, room in self._mirror.items()}
+
+    def _snapshot(self, rooms):
+        # Caller holds _writer; `rooms` is the mirror as of the last record
+        # written. Rotate first so the snapshot covers exactly the segments
+        # before the new one.
+        self._file.close()
+        self._segment += 1
+        self._open_segment()
+        path = os.path.join(self.dir, SNAPSHOT_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'segment': self._segment, 'rooms': rooms}, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        self._snapshot_segment = self._segment
+        self.snapshots += 1
+        self._prune()
+
+    def _prune(self):
+        # Caller holds _writer (or is load()). Keeps the last retain_segments
+        # segments already folded into the snapshot, and all after it.
+        cutoff = self._snapshot_segment - self.retain_segments
+        removed = False
+        for seq, segment in self._segments():
+            if seq >= cutoff: break
+            os.remove(segment)
+            removed = True
+        if not removed: return
+        for game_id in list(self._index):
+            entries = self._index[game_id]
+            keep = bisect_left(entries, (cutoff,))
+            if keep == len(entries):
+                del self._index[game_id]
+            elif keep:
+                del entries[:keep]
+
+    def _open_segment(self):
+        self._file = open(os.path.join(self.dir, f'rooms-{self._segment:06d}.log'), 'ab')
+
+    # --- History ---
+
+    def history(self, game_id):
+        # Every logged event of one room, oldest first: its indexed lines in
+        # the retained segments plus any records not yet written
+        if not self.enabled: return []
+        with self._writer:
+            entries = list(self._index.get(game_id, ()))
+            with self._cond:
+                unwritten = [line for g, line in self._pending if g == game_id]
+        records = []
+        for seq, group in groupby(entries, key=lambda e: e[0]):
+            try:
+                with open(os.path.join(self.dir, f'rooms-{seq:06d}.log'), 'rb') as f:
+                    for _, offset in group:
+                        f.seek(offset)
+                        records.append(json.loads(f.readline()))
+            except FileNotFoundError:
+                pass # pruned since we looked
+        records += [json.loads(line) for line in unwritten]
+        events = []
+        for record in records:
+            event = record['room']['last_event'] if record['t'] == 'c' else record.get('e')
+            if event:
+                events.append(event)
+        return events
+
+    def stats(self):
+        return {'enabled': self.enabled, 'rooms': len(self._mirror), 'records': self.records,
+                'syncs': self.syncs, 'snapshots': self.snapshots, 'segment': self._segment,
+                'indexed_rooms': len(self._index)}
+
+journal = RoomJournal()
@@ -1,88 +1,361 @@
+import heapq
+import selectors
 import socket
+import struct
 import threading
 import time
 import json
 
 BROADCAST_PORT = 5050
-BROADCAST_INTERVAL = 2  # Seconds
+
+# Multicast mode (DISCOVERY_MODE = 'multicast'): an administratively scoped
+# IPv4 group and a link-local IPv6 group, joined on every interface
+MULTICAST_GROUP = '239.255.80.83'
+MULTICAST_GROUP_V6 = 'ff02::5053'
+MULTICAST_TTL = 1 # Stay on the local network
+
+RECV_BUFFER = 1024 # Bytes per datagram, beacons are ~20
+RECV_BATCH = 256 # Datagrams drained per socket per wake-up
+RECV_SOCKET_BUFFER = 1 << 20 # Kernel queue per socket, absorbs beacon storms
+
+# Adaptive beacon rate: send quickly after a change, then back off while
+# nothing changes. MAX_INTERVAL stays well under the 10s peer expiry.
+MIN_INTERVAL = 0.5
+MAX_INTERVAL = 4
+
+# Binary beacon, network byte order:
+#   magic 'RPSB' | version u8 | flags u8 | seq u32 | open_rooms u16 | open_slots u16 | name_len u8 | name utf-8
+BEACON_MAGIC = b'RPSB'
+BEACON_VERSION = 1
+BEACON = struct.Struct('!4sBBIHHB')
+FLAG_CHANGED = 0x01 # Room summary changed since the previous beacon
+
+PEER_TTL = 10 # Seconds a peer stays listed after its last beacon
+PAYLOAD_CACHE_SIZE = 256 # Per-viewer peer lists kept for the current version
+
+def encode_beacon(username, seq, open_rooms=0, open_slots=0, changed=False):
+    name = username.encode()[:255]
+    return BEACON.pack(BEACON_MAGIC, BEACON_VERSION, FLAG_CHANGED if changed else 0,
+                       seq & 0xFFFFFFFF, min(open_rooms, 0xFFFF), min(open_slots, 0xFFFF), len(name)) + name
+
+def decode_beacon(data):
+    # Returns (username, seq, open_rooms, open_slots) or None if not a beacon we understand
+    if len(data) < BEACON.size or not data.startswith(BEACON_MAGIC):
+        return None
+    _, version, _, seq, open_rooms, open_slots, name_len = BEACON.unpack_from(data)
+    if version != BEACON_VERSION or len(data) < BEACON.size + name_len:
+        return None
+    username = data[BEACON.size:BEACON.size + name_len].decode(errors='replace')
+    return username, seq, open_rooms, open_slots
+
+class PeerRegistry:
+    # Peers seen on the LAN, written by the discovery I/O thread and read by every
+    # /api/discovery/peers poll.
+    #   - upsert is O(1): a known peer only gets its fields refreshed
+    #   - expiry uses a min-heap with one entry per peer; an entry that comes
+    #     due for a peer heard from since is re-armed instead of expiring it
+    #   - `version` changes only when membership or a room summary changes,
+    #     and the JSON payload is cached per version
+    def __init__(self, ttl=PEER_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self._lock = threading.Lock()
+        self._peers = {} # {ip: {username, last_seen, ip, seq, open_rooms, open_slots}}
+        self._expiry = [] # [(deadline, ip)]
+        self._snapshot = (-1, []) # (version, [public peer dicts])
+        self._payloads = {} # {excluded username: bytes}, valid for _payload_version
+        self._payload_version = -1
+
+    def upsert(self, ip, username, seq, open_rooms, open_slots):
+        now = time.time()
+        with self._lock:
+            peer = self._peers.get(ip)
+            if peer is not None and peer['username'] == username:
+                if peer['open_rooms'] != open_rooms or peer['open_slots'] != open_slots:
+                    peer['open_rooms'] = open_rooms
+                    peer['open_slots'] = open_slots
+                    self.version += 1
+                peer['last_seen'] = now
+                peer['seq'] = seq
+                return
+            if peer is None:
+                heapq.heappush(self._expiry, (now + self.ttl, ip))
+            self._peers[ip] = {
+                'username': username,
+                'last_seen': now,
+                'ip': ip,
+                'seq': seq,
+                'open_rooms': open_rooms,
+                'open_slots': open_slots
+            }
+            self.version += 1
+
+    def _expire(self):
+        # Caller holds the lock
+        now = time.time()
+        while self._expiry and self._expiry[0][0] <= now:
+            _, ip = heapq.heappop(self._expiry)
+            peer = self._peers.get(ip)
+            if peer is None: continue
+            deadline = peer['last_seen'] + self.ttl
+            if deadline <= now:
+                del self._peers[ip]
+                self.version += 1
+            else:
+                heapq.heappush(self._expiry, (deadline, ip))
+
+    def snapshot(self):
+        # Active peers as public dicts; rebuilt only when the version moves
+        with self._lock:
+            self._expire()
+            version, peers = self._snapshot
+            if version != self.version:
+                peers = [{'username': p['username'], 'ip': p['ip'], 'open_rooms': p['open_rooms'],
+                          'open_slots': p['open_slots']} for p in self._peers.values()]
+                self._snapshot = (self.version, peers)
+            return peers
+
+    def payload(self, exclude=None):
+        # Pre-encoded JSON list of active peers, optionally without one username
+        peers = self.snapshot()
+        with self._lock:
+            if self._payload_version != self._snapshot[0] or len(self._payloads) > PAYLOAD_CACHE_SIZE:
+                self._payloads = {}
+                self._payload_version = self._snapshot[0]
+            body = self._payloads.get(exclude)
+            if body is None:
+                body = json.dumps([p for p in peers if p['username'] != exclude]).encode()
+                self._payloads[exclude] = body
+            return body
 
 class LANDiscovery:
+    # One I/O thread does both sides: a selector watches every receive socket
+    # (plus a wake-up socketpair poked by notify_change) and the select
+    # timeout doubles as the beacon timer. Readable sockets are drained
+    # without blocking, up to RECV_BATCH datagrams each per wake-up.
     def __init__(self):
-        self.peers = {} # {ip: {username, last_seen}}
+        self.peers = PeerRegistry()
         self.running = False
         self.username = None
-        self.broadcast_thread = None
-        self.listen_thread = None
+        self.thread = None
+        self.summary_provider = None # callable -> (open_rooms, open_slots)
+        self.mode = 'broadcast' # or 'multicast'
+        self.group = MULTICAST_GROUP
+        self.group_v6 = MULTICAST_GROUP_V6
+        self.ipv6 = False
+        self.interfaces = None # interface names to use; None means all
+        self.received = 0
+        self._changed = False
+        self._wake_r = self._wake_w = None
+        self._seq = 0
+
+    def configure(self, config):
+        # Reads DISCOVERY_MODE ('broadcast' | 'multicast'), DISCOVERY_GROUP,
+        # DISCOVERY_GROUP_V6, DISCOVERY_IPV6 and DISCOVERY_INTERFACES
+        self.mode = config.get('DISCOVERY_MODE', self.mode)
+        self.group = config.get('DISCOVERY_GROUP', self.group)
+        self.group_v6 = config.get('DISCOVERY_GROUP_V6', self.group_v6)
+        self.ipv6 = config.get('DISCOVERY_IPV6', self.ipv6)
+        self.interfaces = config.get('DISCOVERY_INTERFACES', self.interfaces)
 
     def start_listening(self):
         if self.running: return
         self.running = True
-        
-        # Start listening
-        self.listen_thread = threading.Thread(target=self._listen_loop, daemon=True)
-        self.listen_thread.start()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+
+        self.thread = threading.Thread(target=self._run, name='lan-discovery', daemon=True)
+        self.thread.start()
 
     def start_broadcasting(self, username):
         self.username = username
-        if self.broadcast_thread and self.broadcast_thread.is_alive():
-            return 
-        self.broadcast_thread = threading.Thread(target=self._broadcast_loop, daemon=True)
-        self.broadcast_thread.start()
-
-    def _broadcast_loop(self):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        
-        while self.running and self.username:
-            message = json.dumps({'username': self.username, 'type': 'discovery'})
+        self.start_listening()
+        self.notify_change()
+
+    def notify_change(self):
+        # Cheap, called when the lobby may have changed; the I/O loop wakes
+        # up and re-reads the room summary
+        self._changed = True
+        if self._wake_w is not None:
             try:
-                sock.sendto(message.encode(), ('<broadcast>', BROADCAST_PORT))
-            except Exception as e:
-                print(f"Broadcast error: {e}")
-            time.sleep(BROADCAST_INTERVAL)
-        sock.close()
+                self._wake_w.send(b'\0')
+            except OSError:
+                pass # buffer full, a wake-up is already pending
+
+    def _summary(self):
+        if self.summary_provider is None:
+            return (0, 0)
+        try:
+            return self.summary_provider()
+        except Exception:
+            return (0, 0)
+
+    def _interface_indexes(self):
+        try:
+            names = socket.if_nameindex()
+        except (AttributeError, OSError):
+            return [0]
+        indexes = [i for i, name in names if self.interfaces is None or name in self.interfaces]
+        return indexes or [0]
+
+    def _open_sockets(self):
+        # Returns (receive sockets, [(socket, address, per-send sockopt or None)])
+        if self.mode != 'multicast':
+            rx = self._bound(socket.AF_INET, '')
+            tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            tx.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            return [rx, tx], [(tx, ('<broadcast>', BROADCAST_PORT), None)]
+
+        indexes = self._interface_indexes()
+        sockets, targets = [], []
+
+        v4 = self._bound(socket.AF_INET, '')
+        v4.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, MULTICAST_TTL)
+        group = socket.inet_aton(self.group)
+        joined = []
+        for index in indexes:
+            # struct ip_mreqn selects the interface by index (Linux)
+            mreqn = struct.pack('4s4si', group, socket.inet_aton('0.0.0.0'), index)
+            try:
+                v4.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreqn)
+                joined.append(mreqn)
+            except OSError:
+                pass
+        if not joined:
+            # Portable fallback: let the kernel pick the interface
+            v4.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                          struct.pack('4s4s', group, socket.inet_aton('0.0.0.0')))
+            joined.append(None)
+        sockets.append(v4)
+        targets += [(v4, (self.group, BROADCAST_PORT),
+                     mreqn and (socket.IPPROTO_IP, socket.IP_MULTICAST_IF, mreqn)) for mreqn in joined]
 
-    def _listen_loop(self):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.ipv6 and socket.has_ipv6:
+            v6 = self._bound(socket.AF_INET6, '::')
+            v6.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_HOPS, MULTICAST_TTL)
+            group = socket.inet_pton(socket.AF_INET6, self.group_v6)
+            for index in indexes:
+                try:
+                    v6.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_JOIN_GROUP, group + struct.pack('@I', index))
+                except OSError:
+                    continue
+                targets.append((v6, (self.group_v6, BROADCAST_PORT, 0, index),
+                                (socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_IF, index)))
+            sockets.append(v6)
+        return sockets, targets
+
+    @staticmethod
+    def _bound(family, address):
+        sock = socket.socket(family, socket.SOCK_DGRAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         # On Mac, might need SO_REUSEPORT as well
         try:
              sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         except AttributeError:
              pass
-             
-        sock.bind(('', BROADCAST_PORT))
-        
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_SOCKET_BUFFER)
+        except OSError:
+            pass # capped by the OS, keep its default
+        if family == socket.AF_INET6:
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+        sock.bind((address, BROADCAST_PORT))
+        return sock
+
+    def _run(self):
+        sockets, targets = self._open_sockets()
+        selector = selectors.DefaultSelector()
+        for sock in sockets:
+            sock.setblocking(False)
+            selector.register(sock, selectors.EVENT_READ)
+        selector.register(self._wake_r, selectors.EVENT_READ)
+        buf = bytearray(RECV_BUFFER)
+        failing = set()
+
+        interval = MIN_INTERVAL
+        last_summary = None
+        next_send = time.monotonic()
         while self.running:
+            now = time.monotonic()
+            if self.username and now >= next_send:
+                summary = self._summary()
+                changed = summary != last_summary
+                last_summary = summary
+                self._seq += 1
+                self._send(targets, failing, encode_beacon(self.username, self._seq, *summary, changed=changed))
+                interval = MIN_INTERVAL if changed else min(interval * 2, MAX_INTERVAL)
+                next_send = now + interval
+            timeout = max(next_send - now, 0) if self.username else MAX_INTERVAL
+
+            for key, _ in selector.select(timeout):
+                if key.fileobj is self._wake_r:
+                    self._drain_wakeups()
+                    if self._changed and self.username:
+                        self._changed = False
+                        # Only a summary that differs from the last beacon's
+                        # cuts the back-off short; bursts coalesce into one
+                        if self._summary() != last_summary:
+                            next_send = min(next_send, time.monotonic() + MIN_INTERVAL / 5)
+                else:
+                    self._drain(key.fileobj, buf)
+
+        selector.close()
+        for sock in sockets:
+            sock.close()
+
+    def _send(self, targets, failing, packet):
+        # `failing` holds targets whose last send failed, so an interface
+        # without a route logs once rather than on every beacon
+        for i, (sock, address, option) in enumerate(targets):
             try:
-                data, addr = sock.recvfrom(1024)
-                message = json.loads(data.decode())
-                if message.get('type') == 'discovery':
-                    peer_ip = addr[0]
-                    self.peers[peer_ip] = {
-                        'username': message['username'],
-                        'last_seen': time.time(),
-                        'ip': peer_ip
-                    }
+                if option is not None:
+                    sock.setsockopt(*option)
+                sock.sendto(packet, address)
+                failing.discard(i)
             except Exception as e:
-                # print(f"Listen error: {e}")
+                if i not in failing:
+                    failing.add(i)
+                    print(f"Broadcast error ({address[0]}): {e}")
+
+    def _drain_wakeups(self):
+        try:
+            while self._wake_r.recv(64):
                 pass
-        sock.close()
+        except OSError:
+            pass
+
+    def _drain(self, sock, buf):
+        # Read until the socket would block, at most RECV_BATCH datagrams so
+        # one busy socket can't starve the others or the beacon timer
+        view = memoryview(buf)
+        for _ in range(RECV_BATCH):
+            try:
+                size, addr = sock.recvfrom_into(buf)
+            except OSError:
+                return # BlockingIOError: drained
+            self.received += 1
+            try:
+                self._handle_packet(bytes(view[:size]), addr[0])
+            except Exception:
+                pass # malformed packet
+
+    def _handle_packet(self, data, peer_ip):
+        beacon = decode_beacon(data)
+        if beacon is not None:
+            username, seq, open_rooms, open_slots = beacon
+        elif data[:1] == b'{':
+            # Legacy JSON announcement from older builds
+            message = json.loads(data.decode())
+            if message.get('type') != 'discovery': return
+            username, seq, open_rooms, open_slots = message['username'], 0, 0, 0
+        else:
+            return
+
+        self.peers.upsert(peer_ip, username, seq, open_rooms, open_slots)
 
     def get_active_peers(self):
-        # Filter out peers not seen in last 10 seconds
-        now = time.time()
-        active = []
-        to_remove = []
-        for ip, info in self.peers.items():
-            if now - info['last_seen'] < 10:
-                active.append(info)
-            else:
-                to_remove.append(ip)
-        
-        for ip in to_remove:
-            del self.peers[ip]
-            
-        return active
+        # Peers seen in the last PEER_TTL seconds
+        return self.peers.snapshot()
 
 lan_service = LANDiscovery()
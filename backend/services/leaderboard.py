@@ -0,0 +1,80 @@
+import json
+import threading
+from bisect import bisect_left, insort
+
+TOP_K = 10
+
+class Leaderboard:
+    # In-memory ranking of every user, kept sorted by (-wins, username).
+    # Loaded from the DB once at startup, then updated incrementally as games
+    # finish. Rank lookups and pages are binary searches; the top-K payload
+    # is encoded once per version.
+    def __init__(self, top_k=TOP_K):
+        self.top_k = top_k
+        self.version = 0
+        self._lock = threading.Lock()
+        self._stats = {} # {username: [wins, losses, draws]}
+        self._order = [] # sorted [(-wins, username)]
+        self._encoded = None # (version, body)
+
+    def load(self, rows):
+        # rows: iterable of (username, wins, losses, draws)
+        with self._lock:
+            self._stats = {u: [w or 0, l or 0, d or 0] for u, w, l, d in rows}
+            self._order = sorted((-s[0], u) for u, s in self._stats.items())
+            self.version += 1
+
+    def add_user(self, username):
+        with self._lock:
+            if username in self._stats: return
+            self._stats[username] = [0, 0, 0]
+            insort(self._order, (0, username))
+            self.version += 1
+
+    def record(self, results):
+        # results: {username: (wins, losses, draws)} deltas from finished games
+        with self._lock:
+            for username, (wins, losses, draws) in results.items():
+                stats = self._stats.get(username)
+                if stats is None:
+                    continue # bots and users this server doesn't know
+                if wins:
+                    del self._order[bisect_left(self._order, (-stats[0], username))]
+                    insort(self._order, (-(stats[0] + wins), username))
+                stats[0] += wins
+                stats[1] += losses
+                stats[2] += draws
+            self.version += 1
+
+    def rank(self, username):
+        # 1 + number of users with strictly more wins, ties share a rank
+        with self._lock:
+            stats = self._stats.get(username)
+            if stats is None: return None
+            return bisect_left(self._order, (-stats[0], '')) + 1
+
+    def page(self, offset=0, limit=TOP_K):
+        with self._lock:
+            return [self._entry(u) for _, u in self._order[offset:offset + limit]]
+
+    def entry(self, username):
+        with self._lock:
+            return self._entry(username) if username in self._stats else None
+
+    def _entry(self, username):
+        wins, losses, draws = self._stats[username]
+        return {'username': username, 'wins': wins, 'losses': losses, 'draws': draws}
+
+    def encoded_top(self):
+        cached = self._encoded
+        if cached and cached[0] == self.version:
+            return cached[1]
+        version = self.version
+        body = json.dumps(self.page(0, self.top_k))
+        self._encoded = (version, body)
+        return body
+
+    def etag(self):
+        return f'lb{self.version}'
+
+leaderboard = Leaderboard()
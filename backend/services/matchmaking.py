@@ -0,0 +1,141 @@
+import threading
+import time
+import traceback
+from bisect import bisect_left, insort
+
+from services.scheduler import scheduler
+
+TICK = 1.0 # Seconds between matcher passes while anyone is queued
+BASE_SPREAD = 100 # Rating points a group may span right away
+SPREAD_PER_SECOND = 25 # ...widened for every second its longest waiter has queued
+MAX_SPREAD = 800
+MATCH_TTL = 60 # Seconds a formed match is reported to a player who hasn't picked it up
+
+def rating(wins, losses, draws):
+    # Elo-scaled score from the stored record, shrunk towards 1500 while a
+    # player has few games so newcomers start in the middle of the pool
+    return 1500 + 400 * (wins - losses) / (wins + losses + draws + 10)
+
+class Ticket:
+    __slots__ = ('username', 'ip', 'rating', 'queue', 'enqueued_at')
+
+    def __init__(self, username, ip, rating, queue):
+        self.username = username
+        self.ip = ip
+        self.rating = rating
+        self.queue = queue # (rule_set, max_players)
+        self.enqueued_at = time.monotonic()
+
+    def key(self):
+        return (self.rating, self.enqueued_at, self.username)
+
+class MatchQueue:
+    # Players waiting for a game, one list per (rule_set, max_players) kept
+    # sorted by rating. Every TICK the matcher sweeps each list once: any
+    # run of max_players neighbours whose ratings span no more than the
+    # allowed spread (which grows with the longest wait in the run) becomes
+    # a room via on_match(queue, tickets) -> game_id. A pass is O(queued)
+    # and only runs while someone is waiting.
+    def __init__(self, on_match=None, tick=TICK):
+        self.on_match = on_match
+        self.tick = tick
+        self.matched = self.passes = 0
+        self.last_pass_ms = 0.0
+        self._lock = threading.Lock()
+        self._queues = {} # {(rule_set, max_players): sorted [(rating, enqueued_at, username)]}
+        self._tickets = {} # {username: Ticket}
+        self._results = {} # {username: (game_id, expires_at)}
+        self._timer = None
+
+    def enqueue(self, username, ip, rating, rule_set, max_players):
+        # Re-queueing replaces the player's previous ticket
+        with self._lock:
+            self._remove(username)
+            self._results.pop(username, None)
+            ticket = Ticket(username, ip, rating, (rule_set, max_players))
+            self._tickets[username] = ticket
+            insort(self._queues.setdefault(ticket.queue, []), ticket.key())
+            if self._timer is None:
+                self._timer = scheduler.call_later(self.tick, self._run)
+            return ticket
+
+    def cancel(self, username):
+        with self._lock:
+            return self._remove(username)
+
+    def _remove(self, username):
+        # Caller holds _lock
+        ticket = self._tickets.pop(username, None)
+        if ticket is None: return False
+        entries = self._queues[ticket.queue]
+        del entries[bisect_left(entries, ticket.key())]
+        if not entries:
+            del self._queues[ticket.queue]
+        return True
+
+    def status(self, username):
+        with self._lock:
+            ticket = self._tickets.get(username)
+            if ticket is not None:
+                rule_set, max_players = ticket.queue
+                return {'status': 'queued', 'rule_set': rule_set, 'max_players': max_players,
+                        'rating': round(ticket.rating), 'waiting': len(self._queues[ticket.queue]),
+                        'waited': round(time.monotonic() - ticket.enqueued_at, 1)}
+            result = self._results.get(username)
+            if result is not None and result[1] > time.monotonic():
+                return {'status': 'matched', 'game_id': result[0]}
+            return {'status': 'idle'}
+
+    def spread(self, waited):
+        return min(BASE_SPREAD + SPREAD_PER_SECOND * waited, MAX_SPREAD)
+
+    def _run(self):
+        groups = self.match()
+        for queue, tickets in groups:
+            try:
+                game_id = self.on_match(queue, tickets)
+            except Exception:
+                traceback.print_exc()
+                continue
+            expires_at = time.monotonic() + MATCH_TTL
+            with self._lock:
+                for ticket in tickets:
+                    self._results[ticket.username] = (game_id, expires_at)
+        with self._lock:
+            now = time.monotonic()
+            self._results = {u: r for u, r in self._results.items() if r[1] > now}
+            self._timer = scheduler.call_later(self.tick, self._run) if self._tickets else None
+
+    def match(self):
+        # One matcher pass; takes the formed groups out of the queue and
+        # returns them as [(queue, [Ticket])]
+        start = time.perf_counter()
+        groups = []
+        with self._lock:
+            now = time.monotonic()
+            for queue, entries in list(self._queues.items()):
+                size = queue[1]
+                if len(entries) < size: continue
+                left, i = [], 0
+                while i + size <= len(entries):
+                    run = entries[i:i + size]
+                    oldest = min(enqueued_at for _, enqueued_at, _ in run)
+                    if run[-1][0] - run[0][0] <= self.spread(now - oldest):
+                        groups.append((queue, [self._tickets.pop(username) for _, _, username in run]))
+                        i += size
+                    else:
+                        left.append(entries[i])
+                        i += 1
+                left += entries[i:]
+                if left:
+                    self._queues[queue] = left
+                else:
+                    del self._queues[queue]
+            self.matched += sum(len(tickets) for _, tickets in groups)
+            self.passes += 1
+        self.last_pass_ms = (time.perf_counter() - start) * 1000
+        return groups
+
+    def stats(self):
+        return {'queued': len(self._tickets), 'queues': {f'{r}:{n}': len(e) for (r, n), e in self._queues.items()},
+                'matched': self.matched, 'passes': self.passes, 'last_pass_ms': round(self.last_pass_ms, 3)}
@@ -0,0 +1,75 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+HASH_METHOD = 'scrypt' # werkzeug method string, e.g. 'scrypt:32768:8:1' (N:r:p)
+HASH_WORKERS = 2 # Hashes computed at once, i.e. cores a login storm may take
+HASH_QUEUE = 64 # Hash requests waiting or running before we shed load
+HASH_TIMEOUT = 10 # Seconds a request waits for its hash
+
+class HasherBusy(Exception):
+    pass
+
+class PasswordHasher:
+    # scrypt on a small dedicated pool. hashlib releases the GIL while
+    # hashing, so the pool bounds how much CPU registrations and logins can
+    # take from gameplay requests; past HASH_QUEUE outstanding requests new
+    # ones fail fast with HasherBusy (the routes answer 503).
+    def __init__(self, method=HASH_METHOD, workers=HASH_WORKERS, queue=HASH_QUEUE, timeout=HASH_TIMEOUT):
+        self.method = method
+        self.workers = workers
+        self.queue = queue
+        self.timeout = timeout
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._outstanding = 0
+        self._executor = None
+
+    def configure(self, config):
+        # Reads PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE,
+        # PASSWORD_HASH_TIMEOUT
+        self.method = config.get('PASSWORD_HASH_METHOD', self.method)
+        self.workers = config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.queue = config.get('PASSWORD_HASH_QUEUE', self.queue)
+        self.timeout = config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, method=self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def _run(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._outstanding >= self.queue:
+                self.rejected += 1
+                raise HasherBusy()
+            self._outstanding += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hash')
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._done(None)
+            raise
+        # The hash keeps its slot until it actually finishes, even if the
+        # request gave up on it, so the queue bound covers the pool's backlog
+        future.add_done_callback(self._done)
+        try:
+            return future.result(self.timeout)
+        except FuturesTimeout:
+            future.cancel()
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy()
+
+    def _done(self, _):
+        with self._lock:
+            self._outstanding -= 1
+
+    def stats(self):
+        return {'method': self.method, 'workers': self.workers, 'outstanding': self._outstanding,
+                'queue': self.queue, 'rejected': self.rejected}
+
+password_hasher = PasswordHasher()
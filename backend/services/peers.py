@@ -0,0 +1,178 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+PEER_PORT = 5001
+CONNECT_TIMEOUT = 2 # Seconds
+READ_TIMEOUT = 5
+RETRIES = 2 # Connection attempts only, a POST that reached the host is never resent
+POOL_SIZE = 8 # Keep-alive connections per host
+WORKERS = 16 # Background requests in flight
+FANOUT_WORKERS = 8 # Fan-out requests in flight (invites), kept apart from WORKERS
+LATENCY_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+def netloc(host):
+    # IPv6 peers (multicast discovery) need brackets and an escaped zone id
+    return f"[{host.replace('%', '%25')}]" if ':' in host else host
+
+class HostStats:
+    __slots__ = ('requests', 'errors', 'latency')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.latency = [0] * (len(LATENCY_BUCKETS_MS) + 1) # last bucket is overflow
+
+class PeerClient:
+    # HTTP client for host-to-host calls (proxy_join, proxy_ready, invites).
+    # One keep-alive requests.Session per remote host, retries on connect
+    # failures only, and a bounded executor for calls that shouldn't hold a
+    # Flask worker. Fan-outs get their own smaller executor so a large invite
+    # list can't queue up ahead of single calls like proxy_ready.
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 retries=RETRIES, pool_size=POOL_SIZE, workers=WORKERS, fanout_workers=FANOUT_WORKERS):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.pool_size = pool_size
+        self.workers = workers
+        self.fanout_workers = fanout_workers
+        self._lock = threading.Lock()
+        self._sessions = {} # {host: Session}
+        self._stats = {} # {host: HostStats}
+        self._executor = None
+        self._fanout = None
+
+    def configure(self, config):
+        # Reads PEER_CONNECT_TIMEOUT, PEER_READ_TIMEOUT, PEER_RETRIES,
+        # PEER_POOL_SIZE, PEER_WORKERS and PEER_FANOUT_WORKERS from a Flask config
+        self.connect_timeout = config.get('PEER_CONNECT_TIMEOUT', self.connect_timeout)
+        self.read_timeout = config.get('PEER_READ_TIMEOUT', self.read_timeout)
+        self.retries = config.get('PEER_RETRIES', self.retries)
+        self.pool_size = config.get('PEER_POOL_SIZE', self.pool_size)
+        self.workers = config.get('PEER_WORKERS', self.workers)
+        self.fanout_workers = config.get('PEER_FANOUT_WORKERS', self.fanout_workers)
+
+    def _session(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                retry = Retry(total=self.retries, connect=self.retries, read=0, status=0,
+                              other=0, backoff_factor=0.1, allowed_methods=None)
+                session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size,
+                                                     max_retries=retry))
+                self._sessions[host] = session
+                self._stats[host] = HostStats()
+            return session, self._stats[host]
+
+    def post(self, host, path, payload, timeout=None):
+        # Blocking POST to http://host:5001/path; raises like requests does
+        session, stats = self._session(host)
+        start = time.perf_counter()
+        try:
+            return session.post(f'http://{netloc(host)}:{PEER_PORT}{path}', json=payload,
+                                timeout=(self.connect_timeout, timeout or self.read_timeout))
+        except Exception:
+            with self._lock:
+                stats.errors += 1
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                stats.requests += 1
+                stats.latency[bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def submit(self, host, path, payload, timeout=None):
+        # Non-blocking POST, returns a concurrent.futures.Future
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='peer')
+        return self._executor.submit(self.post, host, path, payload, timeout)
+
+    def fan_out(self, calls, timeout=None):
+        # POSTs every (host, path, payload) on the fan-out executor and yields
+        # (index, response, error) in completion order. Each call's deadline
+        # runs from when it actually starts: connect attempts plus the read
+        # timeout, and a second of slack. A call past it is reported as a
+        # timeout and left to finish on its own; calls still queued when the
+        # whole batch's deadline passes (or the caller stops iterating) are
+        # cancelled before they are sent.
+        with self._lock:
+            if self._fanout is None:
+                self._fanout = ThreadPoolExecutor(max_workers=self.fanout_workers, thread_name_prefix='fanout')
+        budget = self.connect_timeout * (self.retries + 1) + (timeout or self.read_timeout) + 1
+        started = {} # {index: monotonic start}
+
+        def call(i, host, path, payload):
+            started[i] = time.monotonic()
+            return self.post(host, path, payload, timeout)
+
+        futures = {self._fanout.submit(call, i, *c): i for i, c in enumerate(calls)}
+        batch_deadline = time.monotonic() + budget * math.ceil(len(calls) / self.fanout_workers)
+        pending = set(futures)
+        try:
+            while pending:
+                done, _ = wait(pending, timeout=max(self._next_deadline(pending, futures, started, budget,
+                                                                       batch_deadline) - time.monotonic(), 0),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.discard(future)
+                    error = future.exception()
+                    yield futures[future], None if error else future.result(), error
+                now = time.monotonic()
+                for future in list(pending):
+                    i = futures[future]
+                    if i in started and now >= started[i] + budget:
+                        pending.discard(future)
+                        yield i, None, TimeoutError(f'no response after {budget:g} s')
+                    elif i not in started and now >= batch_deadline:
+                        if future.cancel():
+                            pending.discard(future)
+                            yield i, None, TimeoutError('not sent, fan-out deadline passed')
+                        else:
+                            started.setdefault(i, now) # began just now
+        finally:
+            for future in pending:
+                future.cancel()
+
+    @staticmethod
+    def _next_deadline(pending, futures, started, budget, batch_deadline):
+        deadlines = [started[futures[f]] + budget if futures[f] in started else batch_deadline
+                     for f in pending]
+        return min(deadlines)
+
+    def stats(self):
+        with self._lock:
+            hosts = list(self._sessions.items())
+        report = {}
+        for host, session in hosts:
+            stats = self._stats[host]
+            opened = idle = 0
+            for pool in self._pools(session):
+                opened += pool.num_connections
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+            completed = stats.requests - stats.errors
+            report[host] = {
+                'requests': stats.requests,
+                'errors': stats.errors,
+                'connections_opened': opened,
+                'idle_connections': idle,
+                # Share of completed requests that rode an existing connection
+                'reuse_ratio': round(max(completed - opened, 0) / completed, 3) if completed else 0.0,
+                'latency_ms': dict(zip([f'<={b}' for b in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]}'], stats.latency))
+            }
+        return report
+
+    @staticmethod
+    def _pools(session):
+        adapter = session.get_adapter('http://')
+        return [adapter.poolmanager.pools[key] for key in adapter.poolmanager.pools.keys()]
+
+peer_client = PeerClient()
@@ -0,0 +1,171 @@
+import atexit
+import threading
+import time
+import traceback
+
+from collections import Counter
+from itertools import combinations
+
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as upsert
+
+from models import db, User, Match, MatchPlayer, RoundResult, MoveStat, HeadToHead
+from services.identity import identity_cache
+
+FLUSH_INTERVAL = 0.05 # Seconds results are coalesced before one write
+MATCH_ATTEMPTS = 3 # Failed flushes a match's history survives before it is set aside
+
+def game_outcome(scores):
+    # Computed once per finished game: {username: (wins, losses, draws)}.
+    # A single top scorer wins; a shared top score is a draw for those
+    # players (everyone, if all scores are equal); the rest lose.
+    top = max(scores.values())
+    leaders = [p for p, s in scores.items() if s == top]
+    outcome = {p: (0, 1, 0) for p in scores}
+    for p in leaders:
+        outcome[p] = (1, 0, 0) if len(leaders) == 1 else (0, 0, 1)
+    return outcome
+
+RESULT_NAMES = {(1, 0, 0): 'win', (0, 1, 0): 'loss', (0, 0, 1): 'draw'}
+
+class ResultWriter:
+    # Write-behind queue for finished games. submit() only merges the
+    # per-user deltas in memory; a background thread applies everything
+    # queued in the last FLUSH_INTERVAL as one bulk UPDATE ... WHERE
+    # username IN (...), so the request that ends a game never waits on
+    # SQLite. Match history for the same batch goes in with executemany
+    # INSERTs, and the per-user aggregates (move counts, head-to-head) are
+    # summed in memory first so each key is upserted once per batch.
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.interval = interval
+        self.app = None
+        self.flushes = 0
+        self._cond = threading.Condition()
+        self._pending = {} # {username: [wins, losses, draws]}
+        self._matches = [] # match dicts, see submit()
+        self.failed = [] # matches whose history could not be written
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='result-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def submit(self, outcome, match=None):
+        # match: {'id', 'host', 'rule_set', 'scores', 'finished_at',
+        #         'rounds': [(round, {username: move}, {username: score_delta})]}
+        with self._cond:
+            for username, deltas in outcome.items():
+                totals = self._pending.setdefault(username, [0, 0, 0])
+                for i, d in enumerate(deltas):
+                    totals[i] += d
+            if match is not None:
+                match['outcome'] = outcome
+                self._matches.append(match)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._matches)
+            # Let results from other games pile up before writing
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+    def flush(self):
+        if self.app is None:
+            return
+        with self._cond:
+            pending, self._pending = self._pending, {}
+            matches, self._matches = self._matches, []
+        if not pending and not matches:
+            return
+        with self.app.app_context():
+            try:
+                if pending:
+                    db.session.execute(update(User).where(User.username.in_(list(pending))).values(
+                        wins=User.wins + case({u: d[0] for u, d in pending.items()}, value=User.username, else_=0),
+                        losses=User.losses + case({u: d[1] for u, d in pending.items()}, value=User.username, else_=0),
+                        draws=User.draws + case({u: d[2] for u, d in pending.items()}, value=User.username, else_=0)
+                    ))
+                if matches:
+                    self._write_matches(matches)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # Keep the results for the next attempt. A match that keeps
+                # failing is set aside so it can't hold back everything else.
+                self.submit(pending)
+                retry = []
+                for m in matches:
+                    m['attempts'] = m.get('attempts', 0) + 1
+                    if m['attempts'] < MATCH_ATTEMPTS:
+                        retry.append(m)
+                    else:
+                        self.failed.append(m)
+                with self._cond:
+                    self._matches[:0] = retry
+                raise
+        # Logged-in sessions carry cached stats, reload them on next request
+        identity_cache.invalidate_usernames(pending)
+        self.flushes += 1
+
+    @staticmethod
+    def _write_matches(matches):
+        # A match id that is already stored (or repeated in the batch) is
+        # skipped: a duplicate would fail the whole batch, which is requeued
+        # and would fail again on every retry
+        known = set(db.session.scalars(select(Match.id).where(Match.id.in_([m['id'] for m in matches]))))
+        fresh = {}
+        for m in matches:
+            if m['id'] not in known:
+                fresh.setdefault(m['id'], m)
+        matches = list(fresh.values())
+        if not matches: return
+        match_rows, player_rows, round_rows = [], [], []
+        moves = Counter() # {(username, move): count}
+        h2h = Counter() # {(username, opponent, column): count}
+        for m in matches:
+            match_rows.append({'id': m['id'], 'host': m['host'], 'rule_set': m['rule_set'],
+                               'rounds': len(m['rounds']), 'finished_at': m['finished_at']})
+            for username, score in m['scores'].items():
+                player_rows.append({'match_id': m['id'], 'username': username, 'score': score,
+                                    'result': RESULT_NAMES[tuple(m['outcome'][username])],
+                                    'finished_at': m['finished_at']})
+            for number, played, deltas in m['rounds']:
+                for username, move in played.items():
+                    round_rows.append({'match_id': m['id'], 'round': number, 'username': username,
+                                       'move': move, 'score_delta': deltas[username]})
+                    moves[username, move] += 1
+            for a, b in combinations(m['scores'], 2):
+                sa, sb = m['scores'][a], m['scores'][b]
+                column = 'wins' if sa > sb else 'losses' if sa < sb else 'draws'
+                flipped = {'wins': 'losses', 'losses': 'wins', 'draws': 'draws'}[column]
+                h2h[a, b, column] += 1
+                h2h[b, a, flipped] += 1
+
+        db.session.execute(insert(Match), match_rows)
+        db.session.execute(insert(MatchPlayer), player_rows)
+        if round_rows:
+            db.session.execute(insert(RoundResult), round_rows)
+        if moves:
+            stmt = upsert(MoveStat)
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=['username', 'move'], set_={'count': MoveStat.count + stmt.excluded['count']}),
+                [{'username': u, 'move': mv, 'count': n} for (u, mv), n in moves.items()])
+        if h2h:
+            rows = {}
+            for (a, b, column), n in h2h.items():
+                rows.setdefault((a, b), {'username': a, 'opponent': b, 'wins': 0, 'losses': 0, 'draws': 0})[column] = n
+            stmt = upsert(HeadToHead)
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=['username', 'opponent'],
+                set_={c: getattr(HeadToHead, c) + stmt.excluded[c] for c in ('wins', 'losses', 'draws')}),
+                list(rows.values()))
+
+result_writer = ResultWriter()
@@ -0,0 +1,109 @@
+import numpy as np
+
+RESULT_NAMES = {1: 'win', -1: 'lose', 0: 'draw'}
+
+class RuleSet:
+    # A move graph compiled into a dense outcome table. Moves travel as small
+    # integers; the name lookup is case-insensitive since the frontend sends
+    # 'Rock' while older clients send 'rock'.
+    def __init__(self, name, moves, beats):
+        self.name = name
+        self.moves = moves
+        self.index = {m.lower(): i for i, m in enumerate(moves)}
+
+        # outcomes[a, b] is 1 if move a beats move b, -1 if it loses, 0 on a draw
+        self.outcomes = np.zeros((len(moves), len(moves)), dtype=np.int8)
+        for m, targets in beats.items():
+            for t in targets:
+                a, b = self.index[m.lower()], self.index[t.lower()]
+                if self.outcomes[b, a] == 1 or a == b:
+                    raise ValueError(f'{name}: {m} vs {t} is contradictory')
+                self.outcomes[a, b] = 1
+                self.outcomes[b, a] = -1
+        self.wins = (self.outcomes == 1).astype(np.int64)
+
+    def encode(self, move):
+        # Returns the move id, or None for anything that isn't a legal move
+        if not isinstance(move, str): return None
+        return self.index.get(move.lower())
+
+    def canonical(self, move):
+        code = self.encode(move)
+        return None if code is None else self.moves[code]
+
+    def result(self, m1, m2):
+        # m1 vs m2, both move names
+        return RESULT_NAMES[int(self.outcomes[self.encode(m1), self.encode(m2)])]
+
+    def resolve(self, names, codes):
+        # Free-for-all round: every player is compared with every other player
+        # and scores +1 per opponent beaten. Instead of comparing all n^2 pairs,
+        # count how many players threw each move and score per move:
+        # O(n + moves^2).
+        codes = np.asarray(codes, dtype=np.intp)
+        counts = np.bincount(codes, minlength=len(self.moves))
+        deltas = (self.wins @ counts)[codes]
+
+        by_move = {}
+        for name, code in zip(names, codes.tolist()):
+            by_move.setdefault(code, []).append(name)
+        # Everyone who threw the same move beat the same opponents, share the list
+        beaten = {
+            code: [p for target, group in by_move.items() if self.wins[code, target] for p in group]
+            for code in by_move
+        }
+
+        return {
+            name: {'score_delta': int(delta), 'wins_against': beaten[code]}
+            for name, code, delta in zip(names, codes.tolist(), deltas.tolist())
+        }
+
+    def describe(self):
+        return {
+            'name': self.name,
+            'moves': self.moves,
+            'beats': {m: [self.moves[t] for t in np.flatnonzero(self.wins[i])] for i, m in enumerate(self.moves)}
+        }
+
+def balanced(name, moves):
+    # RPS-n games: in this order every move beats the (n - 1) / 2 that follow it
+    n = len(moves)
+    return RuleSet(name, moves, {
+        m: [moves[(i + k) % n] for k in range(1, (n - 1) // 2 + 1)] for i, m in enumerate(moves)
+    })
+
+RULE_SETS = {
+    'rps': balanced('rps', ['Rock', 'Scissors', 'Paper']),
+    'rpsls': RuleSet('rpsls', ['Rock', 'Paper', 'Scissors', 'Lizard', 'Spock'], {
+        'Rock': ['Scissors', 'Lizard'],
+        'Paper': ['Rock', 'Spock'],
+        'Scissors': ['Paper', 'Lizard'],
+        'Lizard': ['Spock', 'Paper'],
+        'Spock': ['Rock', 'Scissors']
+    }),
+    'rps7': balanced('rps7', ['Rock', 'Fire', 'Scissors', 'Sponge', 'Paper', 'Air', 'Water']),
+    'rps15': balanced('rps15', [
+        'Rock', 'Fire', 'Scissors', 'Snake', 'Human', 'Tree', 'Wolf', 'Sponge',
+        'Paper', 'Air', 'Water', 'Dragon', 'Devil', 'Lightning', 'Gun'
+    ]),
+    'rps101': balanced('rps101', [
+        'Dynamite', 'Tornado', 'Quicksand', 'Pit', 'Chain', 'Gun', 'Law', 'Whip', 'Sword', 'Rock',
+        'Death', 'Wall', 'Sun', 'Camera', 'Fire', 'Chainsaw', 'School', 'Scissors', 'Poison', 'Cage',
+        'Axe', 'Peace', 'Computer', 'Castle', 'Snake', 'Blood', 'Porcupine', 'Vulture', 'Monkey', 'King',
+        'Queen', 'Prince', 'Princess', 'Police', 'Woman', 'Baby', 'Man', 'Home', 'Train', 'Car',
+        'Noise', 'Bicycle', 'Tree', 'Turnip', 'Duck', 'Wolf', 'Cat', 'Bird', 'Fish', 'Spider',
+        'Cockroach', 'Brain', 'Community', 'Cross', 'Money', 'Vampire', 'Sponge', 'Church', 'Butter', 'Book',
+        'Paper', 'Cloud', 'Airplane', 'Moon', 'Grass', 'Film', 'Toilet', 'Air', 'Planet', 'Guitar',
+        'Bowl', 'Cup', 'Beer', 'Rain', 'Water', 'TV', 'Rainbow', 'UFO', 'Alien', 'Prayer',
+        'Mountain', 'Satan', 'Dragon', 'Diamond', 'Platinum', 'Gold', 'Devil', 'Fence', 'Video Game', 'Math',
+        'Robot', 'Heart', 'Electricity', 'Lightning', 'Medusa', 'Power', 'Laser', 'Nuke', 'Sky', 'Tank',
+        'Helicopter'
+    ]),
+}
+DEFAULT_RULE_SET = 'rpsls'
+
+def get_rule_set(name=None):
+    return RULE_SETS.get(name or DEFAULT_RULE_SET)
+
+def room_rules(room):
+    return get_rule_set(room.settings.get('rule_set'))
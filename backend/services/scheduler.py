@@ -0,0 +1,73 @@
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+class Timer:
+    __slots__ = ('when', 'fn', 'args', 'cancelled')
+
+    def __init__(self, when, fn, args):
+        self.when = when
+        self.fn = fn
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class Scheduler:
+    # One background thread running callbacks from a min-heap of deadlines.
+    # Scheduling is O(log n) and the thread sleeps exactly until the earliest
+    # deadline, so any number of timers costs one thread. Cancelled timers
+    # are dropped lazily when they reach the top of the heap.
+    def __init__(self, name='scheduler'):
+        self.name = name
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def call_at(self, when, fn, *args):
+        # `when` is on the time.monotonic() clock
+        timer = Timer(when, fn, args)
+        with self._cond:
+            heapq.heappush(self._heap, (when, next(self._seq), timer))
+            if self._heap[0][2] is timer:
+                self._cond.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        return timer
+
+    def call_later(self, delay, fn, *args):
+        return self.call_at(time.monotonic() + max(delay, 0), fn, *args)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _next(self):
+        with self._cond:
+            while True:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                when, _, timer = self._heap[0]
+                if timer.cancelled:
+                    heapq.heappop(self._heap)
+                    continue
+                delay = when - time.monotonic()
+                if delay <= 0:
+                    heapq.heappop(self._heap)
+                    return timer
+                self._cond.wait(delay)
+
+    def _run(self):
+        while True:
+            timer = self._next()
+            try:
+                timer.fn(*timer.args)
+            except Exception:
+                traceback.print_exc()
+
+scheduler = Scheduler()
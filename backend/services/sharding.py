@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import socket
+import tempfile
+import threading
+import traceback
+import uuid
+from bisect import bisect
+
+VNODES = 64 # Points per shard on the ring, evens out the key spread
+MAX_MESSAGE = 65536 # Bytes per backplane datagram
+
+def _point(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+class HashRing:
+    # Consistent hashing of game ids onto shard numbers. Used by the router
+    # (shard.py) to find a room's owner and by workers to mint ids they own.
+    def __init__(self, shards, vnodes=VNODES):
+        self.shards = shards
+        points = sorted((_point(f'{shard}:{v}'), shard) for shard in range(shards) for v in range(vnodes))
+        self._keys = [p for p, _ in points]
+        self._owners = [s for _, s in points]
+
+    def owner(self, key):
+        i = bisect(self._keys, _point(key))
+        return self._owners[i % len(self._owners)]
+
+def socket_dir(port):
+    return os.path.join(tempfile.gettempdir(), f'rps-shards-{port}')
+
+class Backplane:
+    # Fire-and-forget messages between the worker processes of one sharded
+    # deployment, over Unix datagram sockets (one per shard, in a shared
+    # directory). Carries the state every shard needs a copy of (leaderboard
+    # deltas, new users, invites) and shard 0's hand-offs: matches formed by
+    # its queue to the shards that own them, and every shard's lobby summary
+    # back to it for the LAN beacon. With a single shard it does nothing.
+    def __init__(self):
+        self.shard_id = 0
+        self.shards = 1
+        self.ring = None
+        self.dir = None
+        self.sent = self.received = self.dropped = 0
+        self._handlers = {} # {op: fn(payload)}
+        self._sock = None
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self.shards > 1
+
+    def configure(self, config):
+        # Reads SHARD_ID, SHARD_COUNT and SHARD_SOCKET_DIR, set by shard.py
+        self.shard_id = config.get('SHARD_ID', self.shard_id)
+        self.shards = config.get('SHARD_COUNT', self.shards)
+        self.dir = config.get('SHARD_SOCKET_DIR', self.dir)
+        if self.enabled:
+            self.ring = HashRing(self.shards)
+            self.start()
+
+    def on(self, op, fn):
+        self._handlers[op] = fn
+
+    def owner(self, game_id):
+        return self.ring.owner(game_id) if self.ring is not None else self.shard_id
+
+    def new_game_id(self, shard=None):
+        # Rejection-sample uuids until one lands on `shard` (default: this
+        # one), so the router sends the room's requests there (about
+        # `shards` tries on average)
+        shard = self.shard_id if shard is None else shard
+        while True:
+            game_id = str(uuid.uuid4())
+            if self.owner(game_id) == shard:
+                return game_id
+
+    def _path(self, shard):
+        return os.path.join(self.dir, f'shard-{shard}.sock')
+
+    def start(self):
+        if self._thread is not None: return
+        os.makedirs(self.dir, exist_ok=True)
+        path = self._path(self.shard_id)
+        if os.path.exists(path):
+            os.unlink(path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(path)
+        self._thread = threading.Thread(target=self._run, name='backplane', daemon=True)
+        self._thread.start()
+
+    def broadcast(self, op, payload):
+        if not self.enabled: return
+        data = json.dumps({'op': op, 'from': self.shard_id, 'payload': payload}).encode()
+        for shard in range(self.shards):
+            if shard != self.shard_id:
+                self._send(shard, data)
+
+    def send(self, shard, op, payload):
+        # One message to one shard; False if it couldn't be handed over
+        if not self.enabled or shard == self.shard_id: return False
+        return self._send(shard, json.dumps({'op': op, 'from': self.shard_id, 'payload': payload}).encode())
+
+    def _send(self, shard, data):
+        try:
+            self._sock.sendto(data, self._path(shard))
+            self.sent += 1
+            return True
+        except OSError:
+            # Peer not up yet or its queue is full; the message is lost
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            data = self._sock.recv(MAX_MESSAGE)
+            try:
+                message = json.loads(data)
+                handler = self._handlers.get(message['op'])
+                if handler is not None:
+                    handler(message['payload'])
+                self.received += 1
+            except Exception:
+                traceback.print_exc()
+
+    def stats(self):
+        return {'shard': self.shard_id, 'shards': self.shards, 'sent': self.sent,
+                'received': self.received, 'dropped': self.dropped}
+
+backplane = Backplane()
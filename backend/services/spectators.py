@@ -0,0 +1,85 @@
+import asyncio
+import threading
+from collections import deque
+
+SPECTATOR_QUEUE = 64 # Frames a viewer may fall behind before it is dropped
+
+class Spectator:
+    __slots__ = ('frames', 'ready', 'dropped', 'closed')
+
+    def __init__(self):
+        self.frames = deque() # (event id, SSE frame bytes)
+        self.ready = asyncio.Event()
+        self.dropped = False
+        self.closed = False
+
+class SpectatorHub:
+    # Read-only fan-out of one room's events to async viewers (asgi.py).
+    # The publishing thread hands encoded frames over with one
+    # call_soon_threadsafe per event loop, whatever the audience size (and
+    # frames published before the loop gets to them ride the same call);
+    # the loop then appends the same bytes to every viewer's bounded queue.
+    # A viewer whose queue is full (its connection isn't draining) is
+    # dropped rather than holding anything up.
+    def __init__(self, limit=SPECTATOR_QUEUE):
+        self.limit = limit
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._loops = {} # {loop: {Spectator}}
+        self._pending = {} # {loop: [frame]} handed over, not yet delivered
+
+    def __len__(self):
+        return sum(len(viewers) for viewers in self._loops.values())
+
+    @property
+    def active(self):
+        return bool(self._loops)
+
+    def subscribe(self):
+        # Call from the viewer's event loop
+        spectator = Spectator()
+        with self._lock:
+            self._loops.setdefault(asyncio.get_running_loop(), set()).add(spectator)
+        return spectator
+
+    def unsubscribe(self, spectator):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            viewers = self._loops.get(loop)
+            if viewers is None: return
+            viewers.discard(spectator)
+            if not viewers:
+                del self._loops[loop]
+
+    def publish(self, frame):
+        # frame: (event id, bytes), or None once the room is closed
+        with self._lock:
+            wake = []
+            for loop in self._loops:
+                pending = self._pending.setdefault(loop, [])
+                pending.append(frame)
+                if len(pending) == 1:
+                    wake.append(loop)
+        for loop in wake:
+            try:
+                loop.call_soon_threadsafe(self._deliver, loop)
+            except RuntimeError:
+                pass # loop shut down with viewers still registered
+
+    def _deliver(self, loop):
+        # Runs on `loop`
+        with self._lock:
+            frames = self._pending.pop(loop, [])
+            viewers = list(self._loops.get(loop, ()))
+        closed = bool(frames) and frames[-1] is None
+        if closed:
+            frames.pop()
+        for viewer in viewers:
+            if len(viewer.frames) + len(frames) > self.limit:
+                viewer.dropped = True
+                self.dropped += 1
+                self.unsubscribe(viewer)
+            else:
+                viewer.frames.extend(frames)
+                viewer.closed = viewer.closed or closed
+            viewer.ready.set()
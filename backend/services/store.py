@@ -0,0 +1,232 @@
+import heapq
+import threading
+import time
+from collections import defaultdict
+
+from services.feed import RoomFeed
+from services.scheduler import scheduler
+
+class PlayerState:
+    __slots__ = ('username', 'status', 'score', 'move', 'ip', 'joined_at', 'bot')
+
+    def __init__(self, username, ip, status='not_ready', bot=False):
+        self.username = username
+        self.status = status
+        self.score = 0
+        self.move = None
+        self.ip = ip
+        self.joined_at = time.time()
+        self.bot = bot
+
+    def to_dict(self):
+        data = {
+            'status': self.status,
+            'score': self.score,
+            'move': self.move,
+            'ip': self.ip,
+            'joined_at': self.joined_at
+        }
+        if self.bot:
+            data['bot'] = True
+        return data
+
+    def public_dict(self, reveal, spectator=False):
+        # What other players may see: whether this player has moved, and
+        # the move itself only once `reveal` (the game is over). Viewers
+        # outside the room don't get the player's LAN address.
+        data = {
+            'status': self.status,
+            'score': self.score,
+            'has_moved': self.move is not None,
+            'joined_at': self.joined_at
+        }
+        if not spectator:
+            data['ip'] = self.ip
+        if reveal:
+            data['move'] = self.move
+        if self.bot:
+            data['bot'] = True
+        return data
+
+class Room:
+    # One game room. Mutate it only while holding `lock`; membership and
+    # state changes go through RoomStore so its indexes stay in sync.
+    __slots__ = ('game_id', 'host', 'state', 'settings', 'players', 'current_round',
+                 'last_event', 'version', 'updated_at', 'feed', 'bots', 'rounds', 'deadline',
+                 'deadline_timer', 'lock')
+
+    def __init__(self, game_id, host, settings):
+        self.game_id = game_id
+        self.host = host
+        self.state = 'lobby'
+        self.settings = settings
+        self.players = {} # {username: PlayerState}, in join order
+        self.current_round = 1
+        self.last_event = None
+        self.version = 0 # bumped on every mutation, see RoomFeed
+        self.updated_at = time.time() # last mutation, drives expiry
+        self.feed = RoomFeed()
+        self.bots = {} # {bot_name: Bot}, see services/bots.py
+        self.rounds = [] # [(round, {username: move}, {username: score_delta})], for match history
+        self.deadline = None # epoch seconds the current round's moves are due, see RoundTimer
+        self.deadline_timer = None
+        self.lock = threading.RLock()
+
+    def to_dict(self):
+        return {
+            'host': self.host,
+            'state': self.state,
+            'settings': self.settings,
+            'players': {name: p.to_dict() for name, p in self.players.items()},
+            'current_round': self.current_round,
+            'deadline': self.deadline,
+            'last_event': self.last_event,
+            'version': self.version
+        }
+
+    def public_dict(self, spectator=False):
+        # The room as served to clients (/state, see RoomFeed.encode): no
+        # password, and moves hidden until the game is finished. Moves of
+        # past rounds are in the round_over events. spectator=True is the
+        # view for anyone not in the room (/spectate), without player IPs.
+        settings = {k: v for k, v in self.settings.items() if k != 'password'}
+        settings['has_password'] = bool(self.settings.get('password'))
+        reveal = self.state == 'finished'
+        return {
+            'host': self.host,
+            'state': self.state,
+            'settings': settings,
+            'players': {name: p.public_dict(reveal, spectator) for name, p in self.players.items()},
+            'current_round': self.current_round,
+            'deadline': self.deadline,
+            'last_event': self.last_event,
+            'version': self.version
+        }
+
+class RoomStore:
+    # All rooms on this server plus secondary indexes (by host, by player,
+    # by state) so listings cost O(results) rather than a scan of every room.
+    # Lock order: a room's lock may be held while calling into the store,
+    # never the other way round.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rooms = {}
+        self._by_host = defaultdict(set)
+        self._by_player = defaultdict(set)
+        self._by_state = defaultdict(set)
+
+    def __contains__(self, game_id):
+        return game_id in self._rooms
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def get(self, game_id):
+        return self._rooms.get(game_id)
+
+    def add(self, room):
+        with self._lock:
+            self._rooms[room.game_id] = room
+            self._by_host[room.host].add(room.game_id)
+            self._by_state[room.state].add(room.game_id)
+            for username in room.players:
+                self._by_player[username].add(room.game_id)
+
+    def remove(self, game_id):
+        with self._lock:
+            room = self._rooms.pop(game_id, None)
+            if room is None:
+                return None
+            self._discard(self._by_host, room.host, game_id)
+            self._discard(self._by_state, room.state, game_id)
+            for username in room.players:
+                self._discard(self._by_player, username, game_id)
+        room.feed.close()
+        return room
+
+    def add_player(self, room, player):
+        room.players[player.username] = player
+        with self._lock:
+            if room.game_id in self._rooms:
+                self._by_player[player.username].add(room.game_id)
+
+    def remove_player(self, room, username):
+        room.players.pop(username, None)
+        with self._lock:
+            self._discard(self._by_player, username, room.game_id)
+
+    def set_state(self, room, state):
+        with self._lock:
+            if room.game_id in self._rooms:
+                self._discard(self._by_state, room.state, room.game_id)
+                self._by_state[state].add(room.game_id)
+            room.state = state
+
+    def rooms_hosted_by(self, username):
+        return self._lookup(self._by_host, username)
+
+    def rooms_with_player(self, username):
+        return self._lookup(self._by_player, username)
+
+    def rooms_in_state(self, state):
+        return self._lookup(self._by_state, state)
+
+    def _lookup(self, index, key):
+        with self._lock:
+            ids = list(index.get(key, ()))
+            return [self._rooms[i] for i in ids]
+
+    @staticmethod
+    def _discard(index, key, game_id):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(game_id)
+            if not ids:
+                del index[key]
+
+class InviteStore:
+    # Pending invites per local user, safe to append from request threads.
+    # Invites expire after `ttl` seconds; a min-heap of expiry times lets a
+    # single scheduled sweep drop exactly the stale ones.
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._invites = {} # {target_user: [invite, ...]}, oldest first
+        self._expiry = [] # [(expires_at, target_user)]
+        self._sweep = None
+
+    def add(self, target_user, invite):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._invites.setdefault(target_user, []).append(invite)
+            heapq.heappush(self._expiry, (expires_at, target_user))
+            if self._sweep is None:
+                self._sweep = scheduler.call_later(self.ttl, self.sweep)
+
+    def get(self, target_user):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            return [i for i in self._invites.get(target_user, ()) if i['timestamp'] > cutoff]
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(v) for v in self._invites.values())
+
+    def sweep(self):
+        now = time.time()
+        cutoff = now - self.ttl
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                _, target_user = heapq.heappop(self._expiry)
+                pending = self._invites.get(target_user)
+                if not pending: continue
+                # Lists are in arrival order, so stale invites are a prefix
+                stale = 0
+                while stale < len(pending) and pending[stale]['timestamp'] <= cutoff:
+                    stale += 1
+                del pending[:stale]
+                self.evicted += stale
+                if not pending:
+                    del self._invites[target_user]
+            self._sweep = scheduler.call_later(self._expiry[0][0] - now, self.sweep) if self._expiry else None
@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import time
+
+from services.sharding import HashRing, socket_dir
+
+# Sharded deployment on one box: `python shard.py --workers 4` from backend/.
+#
+# Each worker is a normal app process (Flask, or asgi.py with --asgi) on
+# 127.0.0.1 that only creates rooms whose game_id hashes to it on the ring.
+# The router listens on the public port and forwards every request whose
+# room is known (/api/game/<game_id>/..., or game_id in the body of
+# remote_join/remote_ready) to its owner; anything else goes round-robin,
+# except LAN discovery and the matchmaking queue, which only shard 0 runs.
+# GET /api/game/rooms is answered by merging every shard's list. State that
+# every shard needs (leaderboard, users, invites) travels over
+# services/sharding.Backplane.
+#
+# Each forwarded request gets its own upstream connection and the client
+# connection is closed after the response (Connection: close), which keeps
+# the router a byte pump: SSE streams and WebSocket upgrades pass straight
+# through.
+#
+# The parent creates the database schema before spawning, then only routes
+# to workers that are accepting connections. A worker that dies is taken
+# out of rotation (its rooms answer 503) and restarted, up to
+# WORKER_RESTARTS times; one that dies or never listens during startup
+# stops the whole deployment.
+
+ROOM_PATH = re.compile(r'^/api/game/([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})(/|$)')
+BODY_ROUTED = {'/api/game/remote_join', '/api/game/remote_ready'}
+MATCHMAKING_PATH = '/api/game/matchmaking'
+HOP_HEADERS = {'connection', 'keep-alive', 'proxy-connection', 'x-forwarded-for'}
+MAX_HEAD = 64 * 1024
+PIPE_CHUNK = 64 * 1024
+WORKER_START_TIMEOUT = 30 # Seconds a worker has to start listening
+WORKER_CHECK_INTERVAL = 1 # Seconds between liveness checks
+WORKER_RESTARTS = 5 # Restarts per worker before the router gives up
+UNAVAILABLE_RETRY_AFTER = 2 # Seconds, sent while a shard is restarting
+
+class WorkerFailed(Exception):
+    pass
+
+def run_worker(shard, shards, port, sockets, use_asgi):
+    # Runs in a spawned process; create_app reads these as SHARD_* config
+    os.environ.update({
+        'FLASK_SHARD_ID': str(shard),
+        'FLASK_SHARD_COUNT': str(shards),
+        'FLASK_SHARD_SOCKET_DIR': json.dumps(sockets)
+    })
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    if use_asgi:
+        import uvicorn
+        import asgi
+        asgi.flask_app.wsgi_app = ProxyFix(asgi.flask_app.wsgi_app, x_for=1)
+        uvicorn.run(asgi.app, host='127.0.0.1', port=port, log_level='warning')
+    else:
+        from app import create_app
+        from services.lan import lan_service
+        app = create_app()
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1) # request.remote_addr is the client, not the router
+        if shard == 0:
+            lan_service.start_listening()
+        app.run(host='127.0.0.1', port=port, threaded=True)
+
+class Workers:
+    # The worker processes, and the set of shards currently serving (shared
+    # with the Router). monitor() polls them: a shard joins `up` once its
+    # port accepts connections and leaves it when its process exits.
+    def __init__(self, ctx, shards, base_port, sockets, use_asgi):
+        self.ctx = ctx
+        self.shards = shards
+        self.base_port = base_port
+        self.sockets = sockets
+        self.use_asgi = use_asgi
+        self.procs = [None] * shards
+        self.restarts = [0] * shards
+        self.starting = {} # {shard: monotonic deadline to start listening}
+        self.up = set()
+
+    def spawn(self, shard):
+        proc = self.ctx.Process(target=run_worker, name=f'shard-{shard}', daemon=True,
+                                args=(shard, self.shards, self.base_port + shard, self.sockets, self.use_asgi))
+        proc.start()
+        self.procs[shard] = proc
+        self.starting[shard] = time.monotonic() + WORKER_START_TIMEOUT
+
+    async def start(self):
+        for shard in range(self.shards):
+            self.spawn(shard)
+        while self.starting:
+            await self.check(startup=True)
+            await asyncio.sleep(0.1)
+
+    async def monitor(self):
+        while True:
+            await asyncio.sleep(0.1 if self.starting else WORKER_CHECK_INTERVAL)
+            await self.check(startup=False)
+
+    async def check(self, startup):
+        for shard, proc in enumerate(self.procs):
+            if proc.exitcode is not None:
+                self.up.discard(shard)
+                self.starting.pop(shard, None)
+                if startup:
+                    raise WorkerFailed(f'shard {shard} exited during startup (exit code {proc.exitcode})')
+                if self.restarts[shard] >= WORKER_RESTARTS:
+                    raise WorkerFailed(f'shard {shard} exited (exit code {proc.exitcode}) '
+                                       f'after {WORKER_RESTARTS} restarts')
+                self.restarts[shard] += 1
+                print(f'Router: shard {shard} exited (exit code {proc.exitcode}), restarting', file=sys.stderr)
+                self.spawn(shard)
+            elif shard in self.starting:
+                if await self.listening(self.base_port + shard):
+                    del self.starting[shard]
+                    self.up.add(shard)
+                elif time.monotonic() > self.starting[shard]:
+                    raise WorkerFailed(f'shard {shard} not listening after {WORKER_START_TIMEOUT} s')
+
+    @staticmethod
+    async def listening(port):
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+        except OSError:
+            return False
+        writer.close()
+        return True
+
+    def stop(self):
+        for proc in self.procs:
+            if proc is not None:
+                proc.terminate()
+
+class Router:
+    def __init__(self, shards, base_port, up=None):
+        self.ring = HashRing(shards)
+        self.ports = [base_port + i for i in range(shards)]
+        self.up = set(range(shards)) if up is None else up # shards accepting connections
+        self._next = itertools.cycle(range(shards))
+
+    def pick(self, path, body):
+        # Returns the shard to forward to, or None if the one that must
+        # answer is down
+        match = ROOM_PATH.match(path)
+        if match:
+            return self.available(self.ring.owner(match.group(1)))
+        if body:
+            try:
+                game_id = json.loads(body).get('game_id')
+            except (ValueError, AttributeError):
+                game_id = None
+            if isinstance(game_id, str):
+                return self.available(self.ring.owner(game_id))
+        if path.startswith('/api/discovery/') or path == MATCHMAKING_PATH:
+            return self.available(0)
+        for _ in self.ports:
+            shard = next(self._next)
+            if shard in self.up:
+                return shard
+        return None
+
+    def available(self, shard):
+        return shard if shard in self.up else None
+
+    async def handle(self, reader, writer):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+            request_line, *lines = head.decode('latin-1').split('\r\n')
+            method, target, _ = request_line.split(' ', 2)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            writer.close()
+            return
+        headers = [tuple(part.strip() for part in line.split(':', 1)) for line in lines if ':' in line]
+        names = {k.lower(): v for k, v in headers}
+        path, _, query = target.partition('?')
+
+        body = b''
+        if method == 'POST' and path in BODY_ROUTED:
+            body = await reader.readexactly(int(names.get('content-length', 0)))
+        if method == 'GET' and path == '/api/game/rooms':
+            return await self.merge_rooms(query, names.get('origin'), writer)
+
+        upgrade = 'upgrade' in names.get('connection', '').lower()
+        client_ip = writer.get_extra_info('peername')[0]
+        out = [request_line] + [f'{k}: {v}' for k, v in headers if k.lower() not in HOP_HEADERS]
+        out += [f'X-Forwarded-For: {client_ip}', 'Connection: upgrade' if upgrade else 'Connection: close']
+        shard = self.pick(path, body)
+        if shard is None:
+            writer.write(b'HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n'
+                         + f'Retry-After: {UNAVAILABLE_RETRY_AFTER}\r\n'.encode('latin-1')
+                         + b'Connection: close\r\n\r\n')
+            await writer.drain()
+            writer.close()
+            return
+        try:
+            up_reader, up_writer = await asyncio.open_connection('127.0.0.1', self.ports[shard])
+        except OSError:
+            writer.write(b'HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            await writer.drain()
+            writer.close()
+            return
+        up_writer.write(('\r\n'.join(out) + '\r\n\r\n').encode('latin-1') + body)
+
+        upstream = asyncio.ensure_future(self.pipe(reader, up_writer))
+        try:
+            # The worker closes after its response (or the WebSocket) ends
+            await self.pipe(up_reader, writer)
+        finally:
+            upstream.cancel()
+            up_writer.close()
+            writer.close()
+
+    @staticmethod
+    async def pipe(reader, writer):
+        try:
+            while True:
+                data = await reader.read(PIPE_CHUNK)
+                if not data:
+                    if writer.can_write_eof():
+                        writer.write_eof()
+                    return
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, OSError):
+            return
+
+    async def fetch(self, port, target, origin):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        request = f'GET {target} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n'
+        if origin:
+            request += f'Origin: {origin}\r\n'
+        writer.write((request + '\r\n').encode('latin-1'))
+        response = await reader.read()
+        writer.close()
+        head, _, body = response.partition(b'\r\n\r\n')
+        return head.decode('latin-1').split('\r\n')[1:], body
+
+    async def merge_rooms(self, query, origin, writer):
+        target = '/api/game/rooms' + (f'?{query}' if query else '')
+        results = await asyncio.gather(*(self.fetch(port, target, origin) for shard, port in enumerate(self.ports)
+                                         if shard in self.up), return_exceptions=True)
+        merged, cors = [], []
+        for result in results:
+            if isinstance(result, Exception): continue # a shard that's down lists nothing
+            head, body = result
+            merged += json.loads(body)
+            cors = cors or [h for h in head if h.lower().startswith(('access-control-', 'vary'))]
+        body = json.dumps(merged).encode()
+        head = ['HTTP/1.1 200 OK', 'Content-Type: application/json', f'Content-Length: {len(body)}',
+                'Connection: close'] + cors
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+        writer.close()
+
+async def serve(router, host, port, workers=None):
+    if workers is not None:
+        await workers.start()
+    server = await asyncio.start_server(router.handle, host, port, limit=MAX_HEAD)
+    async with server:
+        if workers is None:
+            await server.serve_forever()
+        else:
+            await asyncio.gather(server.serve_forever(), workers.monitor())
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the backend as several room-sharded worker processes')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--worker-port', type=int, default=5101, help='first worker port, on 127.0.0.1')
+    parser.add_argument('--asgi', action='store_true', help='run workers from asgi.py under uvicorn')
+    args = parser.parse_args()
+
+    from app import base_app, create_schema
+    create_schema(base_app())
+
+    sockets = socket_dir(args.port)
+    shutil.rmtree(sockets, ignore_errors=True)
+    workers = Workers(multiprocessing.get_context('spawn'), args.workers, args.worker_port, sockets, args.asgi)
+    router = Router(args.workers, args.worker_port, up=workers.up)
+    try:
+        asyncio.run(serve(router, args.host, args.port, workers))
+    except KeyboardInterrupt:
+        pass
+    except WorkerFailed as e:
+        sys.exit(f'Router: {e}')
+    finally:
+        workers.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,2 @@
+from sim.engine import run_tournament, run_batch, play_match
+from sim.strategies import STRATEGIES, make_strategy
@@ -0,0 +1,28 @@
+import argparse
+
+from services.rules import RULE_SETS
+from sim.engine import run_tournament
+from sim.strategies import STRATEGIES
+
+# Run from backend/:  python -m sim --matches 1000000 --workers 8
+
+def main():
+    parser = argparse.ArgumentParser(description='Headless bot tournament')
+    parser.add_argument('--strategies', nargs='+', default=list(STRATEGIES), choices=list(STRATEGIES))
+    parser.add_argument('--matches', type=int, default=100000, help='Matches per pairing')
+    parser.add_argument('--rounds', type=int, default=3, help='Rounds per match (best of N)')
+    parser.add_argument('--rule-set', default='rpsls', choices=list(RULE_SETS))
+    parser.add_argument('--workers', type=int, default=None, help='Processes, defaults to one per core')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report = run_tournament(args.strategies, args.matches, args.rounds, args.rule_set, args.workers, args.seed)
+
+    print(f"{'pairing':<24} {'wins':>10} {'losses':>10} {'draws':>10}")
+    for (a, b), row in sorted(report['results'].items()):
+        print(f"{a + ' v ' + b:<24} {row['wins']:>10} {row['losses']:>10} {row['draws']:>10}")
+    print(f"\n{report['matches']} matches ({report['rounds']} rounds) in {report['elapsed']:.2f}s "
+          f"on {report['workers']} workers: {report['matches_per_second']:,.0f} matches/s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+from services.rules import get_rule_set
+from sim.strategies import make_strategy
+
+CHUNK_MATCHES = 20000 # Matches per worker task, big enough to amortize pickling
+
+def play_match(outcomes, a, b, rounds):
+    # Same scoring as a 2-player room: +1 per round won, highest score wins.
+    # Returns 1 if a wins, -1 if b wins, 0 on a draw.
+    a.reset()
+    b.reset()
+    score = 0
+    for _ in range(rounds):
+        ma, mb = a.choose(), b.choose()
+        score += outcomes[ma][mb]
+        a.observe(ma, mb)
+        b.observe(mb, ma)
+    return (score > 0) - (score < 0)
+
+def run_batch(rule_set, name_a, name_b, matches, rounds, seed):
+    # One unit of work: `matches` games between two strategies. Runs in a
+    # worker process, so everything it needs is rebuilt from plain arguments.
+    rules = get_rule_set(rule_set)
+    rng = random.Random(seed)
+    a = make_strategy(name_a, rules, rng)
+    b = make_strategy(name_b, rules, rng)
+    outcomes = rules.outcomes.tolist()
+
+    tally = {1: 0, -1: 0, 0: 0}
+    for _ in range(matches):
+        tally[play_match(outcomes, a, b, rounds)] += 1
+    return name_a, name_b, tally[1], tally[-1], tally[0]
+
+def plan(strategies, matches, rounds, rule_set, seed):
+    # Round-robin between all strategies (including mirror matches), split
+    # into CHUNK_MATCHES sized tasks so they shard evenly across processes
+    pairs = list(combinations(strategies, 2)) + [(s, s) for s in strategies]
+    tasks = []
+    for a, b in pairs:
+        remaining = matches
+        while remaining > 0:
+            n = min(CHUNK_MATCHES, remaining)
+            tasks.append((rule_set, a, b, n, rounds, seed + len(tasks)))
+            remaining -= n
+    return tasks
+
+def run_tournament(strategies, matches, rounds=3, rule_set='rpsls', workers=None, seed=0):
+    # workers=1 runs in-process; otherwise shards tasks over a process pool
+    # (defaults to one process per core) and aggregates per pairing
+    tasks = plan(strategies, matches, rounds, rule_set, seed)
+    workers = workers or os.cpu_count() or 1
+
+    start = time.perf_counter()
+    if workers == 1:
+        results = [run_batch(*t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run_batch, *zip(*tasks)))
+    elapsed = time.perf_counter() - start
+
+    table = {}
+    for a, b, wins, losses, draws in results:
+        row = table.setdefault((a, b), {'wins': 0, 'losses': 0, 'draws': 0})
+        row['wins'] += wins
+        row['losses'] += losses
+        row['draws'] += draws
+
+    total = sum(r['wins'] + r['losses'] + r['draws'] for r in table.values())
+    return {
+        'results': table,
+        'matches': total,
+        'rounds': total * rounds,
+        'elapsed': elapsed,
+        'matches_per_second': total / elapsed if elapsed else 0.0,
+        'workers': workers
+    }
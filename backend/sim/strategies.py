@@ -0,0 +1,127 @@
+import random
+
+from services.bots import Bot
+
+# Bot strategies for headless simulation. Every strategy works on move ids
+# (indices into a RuleSet's moves) and exposes the same three calls:
+#   choose()          -> move id to play this round
+#   observe(me, opp)  -> record the round that was just played
+#   reset()           -> forget the opponent, start of a new match
+
+class Strategy:
+    name = 'base'
+
+    def __init__(self, rules, rng=None):
+        self.rules = rules
+        self.n = len(rules.moves)
+        self.rng = rng or random.Random()
+        # counters[m] = moves that beat m
+        wins = rules.wins.tolist()
+        self.counters = [[a for a in range(self.n) if wins[a][m]] for m in range(self.n)]
+
+    def reset(self):
+        pass
+
+    def observe(self, me, opp):
+        pass
+
+    def choose(self):
+        raise NotImplementedError
+
+    def counter(self, predicted):
+        if predicted is None:
+            return self.rng.randrange(self.n)
+        return self.rng.choice(self.counters[predicted])
+
+class RandomStrategy(Strategy):
+    name = 'random'
+
+    def choose(self):
+        return self.rng.randrange(self.n)
+
+class FrequencyStrategy(Strategy):
+    # Counters the opponent's most frequent move so far
+    name = 'frequency'
+
+    def reset(self):
+        self.counts = [0] * self.n
+        self.best = None
+
+    def observe(self, me, opp):
+        self.counts[opp] += 1
+        if self.best is None or self.counts[opp] > self.counts[self.best]:
+            self.best = opp
+
+    def choose(self):
+        return self.counter(self.best)
+
+class MarkovStrategy(Strategy):
+    # First-order Markov chain over the opponent's moves: predicts the most
+    # likely follow-up to their previous move
+    name = 'markov'
+
+    def reset(self):
+        self.counts = [0] * (self.n * self.n) # counts[prev * n + next]
+        self.prev = None
+
+    def observe(self, me, opp):
+        if self.prev is not None:
+            self.counts[self.prev * self.n + opp] += 1
+        self.prev = opp
+
+    def choose(self):
+        if self.prev is None:
+            return self.counter(None)
+        row = self.counts[self.prev * self.n:(self.prev + 1) * self.n]
+        best = max(range(self.n), key=row.__getitem__)
+        return self.counter(best if row[best] else None)
+
+class PatternStrategy(Strategy):
+    # Looks up the longest recent run of opponent moves (up to `depth`) that
+    # has been seen before and counters whatever followed it
+    name = 'pattern'
+    depth = 4
+
+    def reset(self):
+        self.history = []
+        self.seen = {} # {tuple(last k moves): [counts of next move]}
+
+    def observe(self, me, opp):
+        h = self.history
+        for k in range(1, min(self.depth, len(h)) + 1):
+            key = tuple(h[-k:])
+            counts = self.seen.get(key)
+            if counts is None:
+                counts = self.seen[key] = [0] * self.n
+            counts[opp] += 1
+        h.append(opp)
+        if len(h) > self.depth:
+            del h[0]
+
+    def choose(self):
+        h = self.history
+        for k in range(min(self.depth, len(h)), 0, -1):
+            counts = self.seen.get(tuple(h[-k:]))
+            if counts:
+                return self.counter(max(range(self.n), key=counts.__getitem__))
+        return self.counter(None)
+
+class BotStrategy(Strategy):
+    # The in-room server bot (services/bots.py), so it can be tuned offline
+    name = 'bot'
+
+    def reset(self):
+        self.bot = Bot('bot', 'markov', self.rules, self.rng.random())
+
+    def observe(self, me, opp):
+        self.bot.record('opponent', opp)
+
+    def choose(self):
+        return self.bot.choose()
+
+STRATEGIES = {s.name: s for s in (RandomStrategy, FrequencyStrategy, MarkovStrategy, PatternStrategy, BotStrategy)}
+
+def make_strategy(name, rules, rng=None):
+    strategy = STRATEGIES[name](rules, rng)
+    strategy.reset()
+    return strategy
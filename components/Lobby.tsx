@@ -63,8 +63,10 @@ export const Lobby: React.FC<LobbyProps> = ({ gameId, hostIp, currentUser, onSta
 
     useEffect(() => {
         fetchState();
-        const interval = setInterval(fetchState, 1000); // 1s polling
-        return () => clearInterval(interval);
+        // Refetch only when the room pushes an event
+        const source = gameService.openRoomEvents(gameId, hostIp);
+        source.onmessage = () => fetchState();
+        return () => source.close();
     }, [gameId, hostIp]);
 
     const toggleReady = async () => {
@@ -103,7 +105,7 @@ export const Lobby: React.FC<LobbyProps> = ({ gameId, hostIp, currentUser, onSta
                     </h2>
                     <p className="text-slate-400 text-sm mt-1">
                         {APP_STRINGS.bestOf[language]} <span className="text-orange-400 font-bold">{settings.best_of}</span>
-                        {settings.password && <span className="ml-3 text-yellow-500 text-xs">🔒 {APP_STRINGS.passwordProtected[language]}</span>}
+                        {settings.has_password && <span className="ml-3 text-yellow-500 text-xs">🔒 {APP_STRINGS.passwordProtected[language]}</span>}
                     </p>
                 </div>
                 <button onClick={onLeave} className="text-red-400 hover:text-red-300 text-sm underline">
@@ -1,5 +1,5 @@
 import React, { useState, useEffect, useRef } from 'react';
-import { gameService } from '../services/api';
+import { gameService, socketFrame, SOCKET_OPS } from '../services/api';
 import { MOVES_LIST, GAME_RULES, APP_STRINGS } from '../constants';
 import { Move, GameResult } from '../types';
 import { MoveButton } from './MoveButton';
@@ -15,13 +15,14 @@ interface MultiplayerBoardProps {
 export const MultiplayerBoard: React.FC<MultiplayerBoardProps> = ({ gameId, hostIp, topUser, onExit }) => {
     const [gameState, setGameState] = useState<any>(null);
     const [myMove, setMyMove] = useState<Move | null>(null);
-    const [lastProcessedEvent, setLastProcessedEvent] = useState<number>(0);
     const [activeEmote, setActiveEmote] = useState<{ emoji: string, sender: string } | null>(null);
     const [showEmotePicker, setShowEmotePicker] = useState(false);
 
     // Round Result State (Local, to show animation before next round)
     const [roundResult, setRoundResult] = useState<any>(null);
     const [countdown, setCountdown] = useState<number | null>(null);
+    // Open WebSocket to the host, when it serves one; actions fall back to HTTP
+    const socketRef = useRef<WebSocket | null>(null);
 
     const playSound = (type: 'move' | 'win' | 'lose' | 'draw' | 'start' | 'emote') => {
         // ... (Sound logic same as before, omitted for brevity, adding back simpler version)
@@ -54,55 +55,88 @@ export const MultiplayerBoard: React.FC<MultiplayerBoardProps> = ({ gameId, host
     };
 
     useEffect(() => {
-        const interval = setInterval(async () => {
+        const refresh = async () => {
             try {
                 const res = await gameService.getGameState(gameId, hostIp);
-                const newState = res.data;
-                setGameState(newState);
-
-                // Check for new round to clear local state
-                if (newState.current_round > (roundResult?.round || 0) && !newState.last_event?.type.includes('over')) {
-                    // New round started and we are not looking at round over event
-                    // Actually, we clear roundResult when timer expires.
-                }
-
-                if (newState.last_event && newState.last_event.timestamp > lastProcessedEvent) {
-                    setLastProcessedEvent(newState.last_event.timestamp);
-                    const evt = newState.last_event;
-
-                    if (evt.type === 'start' || evt.type === 'game_start') {
-                        playSound('start');
+                setGameState(res.data);
+            } catch (e) { console.error(e); }
+        };
+
+        const handleEvent = (evt: any) => {
+            if (evt.type === 'start' || evt.type === 'game_start') {
+                playSound('start');
+                setRoundResult(null);
+                setMyMove(null);
+            } else if (evt.type === 'emote') {
+                playSound('emote');
+                setActiveEmote({ emoji: evt.emoteId, sender: evt.sender });
+                setTimeout(() => setActiveEmote(null), 3000);
+            } else if (evt.type === 'round_over' || evt.type === 'game_over') {
+                // Show results
+                setRoundResult(evt);
+                setMyMove(null); // Clear my move selection locally (since new round will start)
+                // Play sound based on MY score delta in this round
+                const myDelta = evt.results?.[topUser]?.score_delta || 0;
+                if (myDelta > 0) playSound('win');
+                else playSound('move'); // Draw/Loss
+
+                // Auto-clear round result after 5s if NOT game over
+                if (evt.type === 'round_over') {
+                    setTimeout(() => {
                         setRoundResult(null);
-                        setMyMove(null);
-                    } else if (evt.type === 'emote') {
-                        playSound('emote');
-                        setActiveEmote({ emoji: evt.emoteId, sender: evt.sender });
-                        setTimeout(() => setActiveEmote(null), 3000);
-                    } else if (evt.type === 'round_over' || evt.type === 'game_over') {
-                        // Show results
-                        setRoundResult(evt);
-                        setMyMove(null); // Clear my move selection locally (since new round will start)
-                        // Play sound based on MY score delta in this round
-                        const myDelta = evt.results?.[topUser]?.score_delta || 0;
-                        if (myDelta > 0) playSound('win');
-                        else playSound('move'); // Draw/Loss
-
-                        // Auto-clear round result after 5s if NOT game over
-                        if (evt.type === 'round_over') {
-                            setTimeout(() => {
-                                setRoundResult(null);
-                            }, 5000);
-                        }
-                    }
+                    }, 5000);
                 }
-            } catch (e) { console.error(e); }
-        }, 1000);
-        return () => clearInterval(interval);
-    }, [gameId, hostIp, lastProcessedEvent, topUser]);
+            }
+        };
+
+        refresh();
+        // Events arrive in order and are resumed via Last-Event-ID on reconnect,
+        // so every event is handled exactly once.
+        let lastId = 0;
+        const onEvent = (data: string) => {
+            const evt = JSON.parse(data);
+            if (evt.id !== undefined) {
+                if (evt.id <= lastId) return; // already seen on the other channel
+                lastId = evt.id;
+            }
+            handleEvent(evt);
+            refresh();
+        };
+        const openEvents = () => {
+            const events = gameService.openRoomEvents(gameId, hostIp);
+            events.onmessage = (msg) => onEvent(msg.data);
+            return events;
+        };
+        let source = openEvents();
+
+        // Prefer the WebSocket when the host has one: it carries both our
+        // actions and the room events, so the SSE stream is closed once it
+        // opens. Both start at the room's current version; ids dedupe the overlap.
+        const socket = gameService.openRoomSocket(gameId, hostIp);
+        socket.onopen = () => {
+            source.close();
+            socketRef.current = socket;
+        };
+        socket.onmessage = (msg) => {
+            if (typeof msg.data === 'string') onEvent(msg.data);
+        };
+        socket.onclose = () => {
+            // Dropped after opening: go back to SSE for events
+            if (socketRef.current === socket) source = openEvents();
+            socketRef.current = null;
+        };
+        return () => {
+            socket.onclose = null;
+            source.close();
+            socket.close();
+        };
+    }, [gameId, hostIp, topUser]);
 
     const handleMove = async (moveId: Move) => {
         try {
-            await gameService.submitMove(gameId, topUser, moveId, hostIp);
+            const socket = socketRef.current;
+            if (socket?.readyState === WebSocket.OPEN) socket.send(socketFrame(SOCKET_OPS.MOVE_NAME, moveId));
+            else await gameService.submitMove(gameId, topUser, moveId, hostIp);
             setMyMove(moveId);
             playSound('move');
         } catch (e) { console.error(e); }
@@ -110,7 +144,9 @@ export const MultiplayerBoard: React.FC<MultiplayerBoardProps> = ({ gameId, host
 
     const sendEmote = async (emoji: string) => {
         try {
-            await gameService.sendEmote(gameId, emoji, topUser, hostIp); // fix api signature
+            const socket = socketRef.current;
+            if (socket?.readyState === WebSocket.OPEN) socket.send(socketFrame(SOCKET_OPS.EMOTE, emoji));
+            else await gameService.sendEmote(gameId, emoji, topUser, hostIp); // fix api signature
             setShowEmotePicker(false);
         } catch (e) { console.error(e); }
     };
@@ -161,7 +197,7 @@ export const MultiplayerBoard: React.FC<MultiplayerBoardProps> = ({ gameId, host
                         const pData = players[pName];
                         const isMe = pName === topUser;
                         const isHost = pName === gameState.host;
-                        const hasMoved = pData.move !== null; // Real-time status
+                        const hasMoved = pData.has_moved; // Real-time status (moves stay hidden until game over)
 
                         // If showing results, use `roundResult.moves`
                         const resultMove = roundResult?.moves?.[pName];
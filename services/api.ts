@@ -1,5 +1,15 @@
 import axios from 'axios';
 
+// Binary frames for the room WebSocket, see backend/asgi.py
+export const SOCKET_OPS = { MOVE_NAME: 0x02, READY: 0x03, EMOTE: 0x04 };
+export const socketFrame = (op: number, text = '') => {
+    const payload = new TextEncoder().encode(text);
+    const frame = new Uint8Array(1 + payload.length);
+    frame[0] = op;
+    frame.set(payload, 1);
+    return frame;
+};
+
 const API_URL = 'http://localhost:5001/api';
 
 export const api = axios.create({
@@ -37,10 +47,32 @@ export const gameService = {
     // Legacy support
     sendChallenge: (targetIp: string, targetUsername: string, password?: string) =>
         api.post('/game/challenge', { target_ip: targetIp, target_username: targetUsername, password }),
+    // Invite many peers at once; the response is one JSON line per peer
+    inviteMany: (gameId: string, peers: { ip: string, username: string }[]) =>
+        api.post(`/game/${gameId}/invite_many`, { peers }, { responseType: 'text' }),
     getGameState: (gameId: string, hostIp?: string) => {
         const url = hostIp ? `http://${hostIp}:5001/api/game/${gameId}/state` : `/game/${gameId}/state`;
         return axios.get(url, { withCredentials: true });
     },
+    // Server-Sent Events stream of room events (replaces 1s /state polling)
+    openRoomEvents: (gameId: string, hostIp?: string) => {
+        const url = hostIp ? `http://${hostIp}:5001/api/game/${gameId}/events` : `${API_URL}/game/${gameId}/events`;
+        return new EventSource(url, { withCredentials: true });
+    },
+    // Read-only stream for viewers outside the room: a 'state' event with the
+    // room, then room events; ends with 'dropped' if the viewer falls behind
+    spectateRoom: (gameId: string, hostIp?: string) => {
+        const url = hostIp ? `http://${hostIp}:5001/api/game/${gameId}/spectate` : `${API_URL}/game/${gameId}/spectate`;
+        return new EventSource(url);
+    },
+    // Per-room WebSocket (only when the host runs backend/asgi.py): pushes
+    // room events as JSON text frames and takes binary action frames
+    openRoomSocket: (gameId: string, hostIp?: string, since?: number) => {
+        const base = hostIp ? `ws://${hostIp}:5001/api` : API_URL.replace(/^http/, 'ws');
+        const socket = new WebSocket(`${base}/game/${gameId}/ws${since !== undefined ? `?since=${since}` : ''}`);
+        socket.binaryType = 'arraybuffer';
+        return socket;
+    },
     getLeaderboard: () => api.get('/game/leaderboard'),
     sendEmote: (gameId: string, emoteId: string, sender: string, hostIp?: string) => {
         const url = hostIp ? `http://${hostIp}:5001/api/game/${gameId}/emote` : `/game/${gameId}/emote`;
@@ -62,8 +94,20 @@ export const gameService = {
         // Use `acceptInvite` logic?
         return api.post(`/game/${gameId}/accept`, { host_ip: hostIp, password });
     },
-    createRoom: (maxPlayers: number, bestOf: number, password?: string) =>
-        api.post('/game/create_room', { max_players: maxPlayers, best_of: bestOf, password }),
+    // moveTimeout: seconds per round (0 = none); idle players then forfeit, or get a random move with 'random'
+    createRoom: (maxPlayers: number, bestOf: number, password?: string, ruleSet?: string,
+                 moveTimeout?: number, timeoutPolicy?: 'forfeit' | 'random') =>
+        api.post('/game/create_room', {
+            max_players: maxPlayers, best_of: bestOf, password, rule_set: ruleSet,
+            move_timeout: moveTimeout, timeout_policy: timeoutPolicy
+        }),
+    getRuleSets: () => api.get('/game/rules'),
+
+    // Matchmaking queue: poll getMatchmaking until status is 'matched' (then join game_id)
+    joinMatchmaking: (maxPlayers: number, ruleSet?: string) =>
+        api.post('/game/matchmaking', { max_players: maxPlayers, rule_set: ruleSet }),
+    getMatchmaking: () => api.get('/game/matchmaking'),
+    leaveMatchmaking: () => api.delete('/game/matchmaking'),
 
     submitMove: (gameId: string, username: string, move: string, hostIp?: string) => {
         const url = hostIp ? `http://${hostIp}:5001/api/game/${gameId}/move` : `/game/${gameId}/move`;